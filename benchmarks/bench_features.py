@@ -0,0 +1,57 @@
+"Scaling benchmark of the vectorised features against the former Python row loops"
+import sys
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent/'code'))
+from features import vehicle_age, add_date_features, person_severity_counts
+
+# %%--  Settings
+ROWS = [10**3, 10**4, 10**5, 10**6]
+REPEAT = 3
+# %%-
+
+# %%--  Helpers
+def best_time(func, repeat=REPEAT):
+    "Best wall time of repeat calls, in seconds"
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-start)
+    return min(times)
+
+def vehicles(n, seed=0):
+    "Random accident dates and manufacturing years shaped like the merged VEHICLE table"
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ACCIDENTDATE': pd.to_datetime("2006-01-01")+pd.to_timedelta(rng.integers(0, 6000, n), unit="D"),
+        'VEHICLE_YEAR_MANUF': rng.integers(1960, 2020, n).astype(float),
+    })
+
+def persons(n, seed=0):
+    "Random PERSON rows, about 2.5 persons per accident"
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ACCIDENT_NO': rng.integers(0, max(n*2//5, 1), n).astype(str),
+        'INJ_LEVEL': rng.integers(1, 5, n),
+    })
+# %%-
+
+# %%--  Benchmarks
+def main():
+    print("%10s %14s %14s %10s %14s %14s %14s"%("rows", "age loop [s]", "age vect [s]", "speedup", "dates [s]", "persons gb [s]", "persons bc [s]"))
+    for n in ROWS:
+        df = vehicles(n)
+        person = persons(n)
+        loop = best_time(lambda: [date.year-manuf for date, manuf in zip(df['ACCIDENTDATE'], df['VEHICLE_YEAR_MANUF'])])
+        vect = best_time(lambda: vehicle_age(df['ACCIDENTDATE'], df['VEHICLE_YEAR_MANUF']))
+        dates = best_time(lambda: add_date_features(df))
+        groupby = best_time(lambda: person.groupby(['ACCIDENT_NO', 'INJ_LEVEL']).size().unstack(fill_value=0))
+        bincount = best_time(lambda: person_severity_counts(person))
+        print("%10d %14.4f %14.4f %9.0fx %14.4f %14.4f %14.4f"%(n, loop, vect, loop/vect, dates, groupby, bincount))
+
+if __name__ == "__main__":
+    main()
+# %%-
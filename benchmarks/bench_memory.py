@@ -0,0 +1,110 @@
+"Memory footprint of the tables and peak memory of the section queries, former full copies against the lean query layer"
+import argparse
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+import pandas as pd
+sys.path.insert(0, str(Path(__file__).parent.parent/'code'))
+from dataloader import CACHE_FOLDER, FILENAMES, CrashDataset, optimise_dtypes
+from derived import DERIVED_FOLDER, clear_memory, read_features
+from profiling import peak_rss
+from run_benchmarks import start_arrow
+from synthetic import generate
+
+# %%--  Settings
+WORKDIR = Path(__file__).parent/'data'
+VARIANTS = {
+    "former": "former csv loads and query",
+    "rebuild": "lean query building the cache",
+    "lean": "lean query on the persisted features",
+}
+# %%-
+
+# %%--  Measurement
+def run_variant(datadir, variant):
+    """Peak RSS growth [MB] of a variant, table loads included.
+
+    Runs in a fresh interpreter started by measure_variant, so memory freed by
+    another variant cannot be reused and pandas and Arrow allocations are
+    counted alike. The lean query rebuilds whatever of the typed tables and
+    features is missing from the cache. The query alone is not measured: the copies of the former
+    query fit in the memory freed by read_csv, so they never raise the peak.
+    """
+    start_arrow()
+    start = peak_rss()
+    if variant == "former":
+        former_query({f: pd.read_csv(datadir/(f+".csv"), low_memory=False) for f in FILENAMES})
+    else:
+        lean_query(CrashDataset(datadir), rebuild=variant == "rebuild")
+    return peak_rss()-start
+
+def measure_variant(datadir, variant):
+    """Run a variant in a separate process, returns the peak of run_variant [MB].
+
+    Linux carries the peak RSS of a process over exec into its children, so
+    this must be called before the calling process loads any large table.
+    """
+    out = subprocess.run([sys.executable, __file__, "--datadir", str(datadir), "--variant", variant], capture_output=True, text=True, check=True)
+    return float(out.stdout.split()[-1])
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum()/2**20
+# %%-
+
+# %%--  Section queries
+def former_query(dfs_dic):
+    "A3 as it was: full-width deep copies of the filtered tables merged in memory"
+    df = dfs_dic["ACCIDENT"].loc[dfs_dic["ACCIDENT"]["SEVERITY"]<3].copy(deep=True)
+    df['NO_PERSONS_KILLED'] = df['NO_PERSONS_KILLED']/df['NO_PERSONS_KILLED'].sum()*100
+    df['NO_PERSONS_INJ_2'] = df['NO_PERSONS_INJ_2']/df['NO_PERSONS_INJ_2'].sum()*100
+    df_vehic = dfs_dic['VEHICLE'].loc[dfs_dic['VEHICLE']['VEHICLE_ID'] == "A"].copy(deep=True)
+    df = pd.merge(df, df_vehic, how="left", on="ACCIDENT_NO")
+    return df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','VEHICLE_MAKE']].groupby("VEHICLE_MAKE").sum()
+
+def lean_query(ds, rebuild=False):
+    """A3 now: projected columns of the accident features, joined once through the key index.
+
+    With rebuild the persisted features are deleted first, so the peak includes
+    the projected reads of every table the features are joined from.
+    """
+    clear_memory()
+    if rebuild: shutil.rmtree(Path(ds.datadir)/CACHE_FOLDER/DERIVED_FOLDER, ignore_errors=True)
+    df = read_features(ds, columns=['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','VEHICLE_MAKE'], filters=[("SEVERITY","<",3)])
+    df['NO_PERSONS_KILLED'] = df['NO_PERSONS_KILLED']/df['NO_PERSONS_KILLED'].sum()*100
+    df['NO_PERSONS_INJ_2'] = df['NO_PERSONS_INJ_2']/df['NO_PERSONS_INJ_2'].sum()*100
+    return df.groupby("VEHICLE_MAKE", observed=True)[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2']].sum()
+# %%-
+
+# %%--  Command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the memory of the former full copies and of the lean query layer")
+    parser.add_argument("--datadir", help="Folder with CrashStats csv files, a synthetic extract by default")
+    parser.add_argument("--scale", type=float, default=1, help="Scale of the synthetic extract")
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.variant:
+        print("%.1f"%run_variant(Path(args.datadir), args.variant))
+        return
+
+    datadir = Path(args.datadir) if args.datadir else WORKDIR/("scale_%g"%args.scale)
+    if not (datadir/"ACCIDENT.csv").exists(): generate(datadir, args.scale)
+    shutil.rmtree(datadir/CACHE_FOLDER, ignore_errors=True)
+
+    #   Peak RSS of A3 in a separate process per variant, started while this one is still small. The first lean query builds the cache from the csv files, the second reads the features it persisted
+    for variant, label in VARIANTS.items():
+        print("A3 peak, %-40s %8.1f MB"%(label+":", measure_variant(datadir, variant)))
+    ds = CrashDataset(datadir)
+
+    #   Resident size of every table, as parsed by read_csv and as typed in the cache
+    print("%-24s %12s %12s"%("table", "csv [MB]", "typed [MB]"))
+    raw = {}
+    for filename in FILENAMES:
+        raw[filename] = pd.read_csv(datadir/(filename+".csv"), low_memory=False)
+        typed = optimise_dtypes(raw[filename].copy())
+        print("%-24s %12.1f %12.1f"%(filename, frame_mb(raw[filename]), frame_mb(typed)))
+    print("%-24s %12.1f %12.1f"%("total", sum(frame_mb(df) for df in raw.values()), sum(frame_mb(ds[f]) for f in FILENAMES)))
+
+if __name__ == "__main__":
+    main()
+# %%-
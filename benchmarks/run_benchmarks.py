@@ -0,0 +1,121 @@
+"Times and memory-profiles the load, merge, aggregation and render stages on synthetic extracts"
+import argparse
+import io
+import json
+import shutil
+import sys
+from pathlib import Path
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pyarrow.csv as pv
+sys.path.insert(0, str(Path(__file__).parent.parent/'code'))
+from dataloader import FILENAMES, CACHE_FOLDER, CrashDataset, build_cache, ingest, load_table
+from derived import DERIVED_FOLDER, clear_memory, serious_accident_nodes
+from cube import CategoryCube
+from jobs import JOBS, select_jobs
+from profiling import isolated
+import injury_statistics
+import location_statistics
+from synthetic import generate
+
+# %%--  Settings
+WORKDIR = Path(__file__).parent/'data'
+# %%-
+
+# %%--  Measurement
+def measure(func, keep=False):
+    """Run func in a forked child, returns its result if keep [else None], wall time [s], peak RSS growth [MB] and rows.
+
+    Peak RSS sees the Arrow memory pool and numpy buffers that tracemalloc
+    misses. Every stage starts from the memory of the benchmark process, so
+    tables and derived tables loaded by one stage are not shared with the next.
+    """
+    def run():
+        result = func()
+        return (result if keep else None), rows(result)
+    (result, count), duration, peak = isolated(run, setup=start_arrow)
+    return result, duration, peak, count
+
+def start_arrow():
+    "Start the Arrow thread pools of a forked child, so their stacks are not counted in the stage peak"
+    pv.read_csv(io.BytesIO(b"a,b\n1,x\n")).to_pandas()
+
+def rows(result):
+    "Number of rows of a stage result when it has any"
+    if hasattr(result, "__len__") and hasattr(result, "columns"): return len(result)
+    if isinstance(result, dict): return sum(rows(v) or 0 for v in result.values()) or None
+    return None
+
+def reset_derived(ds):
+    "Forget derived tables in memory and on disk so every job pays for its own merges"
+    clear_memory()
+    shutil.rmtree(Path(ds.datadir)/CACHE_FOLDER/DERIVED_FOLDER, ignore_errors=True)
+# %%-
+
+# %%--  Stages
+def primitive_stages(ds):
+    "Merge and aggregation primitives shared by several sections"
+    def merge():
+        reset_derived(ds)
+        return serious_accident_nodes(ds)
+    def cube():
+        df = ds.read("ACCIDENT", columns=['SPEED_ZONE','Day Week Description','Accident Type Desc','Light Condition Desc','Road Geometry Desc','NO_PERSONS_KILLED','NO_PERSONS_INJ_2'], filters=[("SEVERITY","<",3)])
+        return CategoryCube(df, dimensions=['SPEED_ZONE','Day Week Description','Accident Type Desc','Light Condition Desc','Road Geometry Desc'], measures=['NO_PERSONS_KILLED','NO_PERSONS_INJ_2']).marginal('SPEED_ZONE')
+    return [("merge", "serious_accident_nodes", merge), ("aggregation", "category_cube", cube)]
+
+def run_scale(scale, workdir, names, regenerate=False):
+    "Benchmark every stage on a synthetic extract of the given scale, returns a list of records"
+    datadir = Path(workdir)/("scale_%g"%scale)
+    if regenerate or not (datadir/"ACCIDENT.csv").exists():
+        _, duration, _, _ = measure(lambda: generate(datadir, scale))
+        print("Generated scale %g extract in %.1fs"%(scale, duration))
+    shutil.rmtree(datadir/CACHE_FOLDER, ignore_errors=True)
+    ds = CrashDataset(datadir)
+    records = []
+    def record(stage, name, func, keep=False):
+        result, duration, peak, count = measure(func, keep)
+        records.append({"scale": scale, "stage": stage, "name": name, "seconds": duration, "peak_mb": peak, "rows": count})
+        print("%6g %-12s %-32s %9.3fs %10.1f MB"%(scale, stage, name, duration, peak))
+        return result
+
+    #   Loads: csv parse into the typed cache, then cached reads
+    for filename in FILENAMES: record("load_csv", filename, lambda: build_cache(datadir, filename))
+    shutil.rmtree(datadir/CACHE_FOLDER, ignore_errors=True)
+    record("load_csv", "parallel ingest", lambda: ingest(datadir))
+    for filename in FILENAMES: record("load_cache", filename, lambda: load_table(datadir, filename))
+
+    for stage, name, func in primitive_stages(ds): record(stage, name, func)
+
+    #   Figure jobs: data [load, merge, aggregation], render and png encode
+    for job_name in names:
+        job = JOBS[job_name]
+        reset_derived(ds)
+        data = record("data", job_name, lambda: job.data(ds), keep=True)
+        if job.plot is None: continue
+        fig = record("render", job_name, lambda: job.plot(data, job.figname), keep=True)
+        if fig is not None:
+            record("encode", job_name, lambda: fig.savefig(io.BytesIO(), format="png", transparent=True, bbox_inches='tight'))
+            plt.close(fig)
+    return records
+# %%-
+
+# %%--  Command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the figure pipeline on synthetic CrashStats extracts")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1], help="Multiples of the real extract size [e.g. 1 10 100]")
+    parser.add_argument("--jobs", nargs="*", help="Figure jobs to benchmark, all by default")
+    parser.add_argument("--workdir", default=str(WORKDIR), help="Folder where the synthetic extracts are kept")
+    parser.add_argument("--regenerate", action="store_true", help="Write the synthetic extracts again")
+    parser.add_argument("--output", help="JSON file where the records are written")
+    args = parser.parse_args(argv)
+
+    names = select_jobs(args.jobs)
+    records = []
+    for scale in args.scale: records += run_scale(scale, args.workdir, names, args.regenerate)
+    if args.output:
+        with open(args.output, "w") as f: json.dump(records, f, indent=1)
+
+if __name__ == "__main__":
+    main()
+# %%-
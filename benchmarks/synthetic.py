@@ -0,0 +1,280 @@
+"Synthetic CrashStats extract generator with the schema and join fan-out of the real tables"
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# %%--  Settings
+#   Approximate row counts of the 2006-2020 extract [scale 1]
+ACCIDENTS = 204000
+VEHICLES_PER_ACCIDENT = 1.83
+PERSONS_PER_ACCIDENT = 2.45
+CHUNK = 200000          # Accidents generated and written at once
+
+SEVERITY = ([1, 2, 3, 4], [0.016, 0.33, 0.652, 0.002])
+SPEED_ZONES = ([40, 50, 60, 70, 80, 90, 100, 110, 777, 888, 999], [0.04, 0.12, 0.38, 0.07, 0.1, 0.01, 0.16, 0.04, 0.02, 0.01, 0.05])
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+ACCIDENT_TYPES = ([
+    'Collision with vehicle', 'Struck Pedestrian', 'Struck animal', 'Collision with a fixed object',
+    'collision with some other object', 'Vehicle overturned (no collision)', 'Fall from or in moving vehicle',
+    'No collision and no object struck', 'Other accident',
+], [0.61, 0.08, 0.01, 0.17, 0.01, 0.02, 0.02, 0.07, 0.01])
+LIGHT_CONDITIONS = ([
+    'Day', 'Dusk/Dawn', 'Dark Street lights on', 'Dark Street lights off',
+    'Dark No street lights', 'Dark Street lights unknown', 'Unk.',
+], [0.66, 0.07, 0.16, 0.01, 0.08, 0.01, 0.01])
+ROAD_GEOMETRIES = ([
+    'Cross intersection', 'T intersection', 'Y intersection', 'Multiple intersection', 'Not at intersection',
+    'Dead end', 'Road closure', 'Private property', 'Unknown',
+], [0.15, 0.3, 0.01, 0.01, 0.51, 0.01, 0.001, 0.002, 0.007])
+ATMOSPH_CONDS = ([
+    'Clear', 'Raining', 'Snowing', 'Fog', 'Smoke', 'Dust', 'Strong winds', 'Not known', 'Not Applicable',
+], [0.82, 0.1, 0.001, 0.006, 0.001, 0.001, 0.005, 0.06, 0.006])
+VEHICLE_TYPES = ([1, 2, 4, 5, 6, 10, 13, 71, 72], [
+    'Car', 'Station Wagon', 'Utility', 'Panel Van', 'Prime Mover Only', 'Motor Cycle',
+    'Bicycle', 'Light Commercial Vehicle (Rigid) <= 4.5 Tonnes GVM', 'Heavy Vehicle (Rigid) > 4.5 Tonnes',
+], [0.45, 0.2, 0.1, 0.03, 0.02, 0.07, 0.05, 0.05, 0.03])
+MAKES = ['TOYOTA', 'HOLDEN', 'FORD', 'MAZDA', 'NISSAN', 'MITSUB', 'HYUNDAI', 'HONDA', 'SUBARU', 'VOLKS', 'KIA', 'BMW', 'MERC B', 'SUZUKI', 'AUDI', 'KAWASA', 'YAMAHA', 'ISUZU', 'KENWOR', 'LEXUS']
+IMPACTS = list('0123456789FNRSTU')
+INJ_LEVELS = ([1, 2, 3, 4], ['Fatality', 'Serious injury', 'Other injury', 'Not injured'])
+LGAS = ['MELBOURNE', 'GREATER BENDIGO', 'CASEY', 'WYNDHAM', 'HUME', 'GEELONG', 'BALLARAT', 'MONASH', 'WHITTLESEA', 'BRIMBANK']
+
+#   VICGRID94 clusters [x, y, standard deviation, weight]: Melbourne CBD, metro, Bendigo, Geelong, rural
+CLUSTERS = [
+    (2.4965e6, 2.4098e6, 1.5e3, 0.05),
+    (2.4965e6, 2.4098e6, 2.0e4, 0.6),
+    (2.4325e6, 2.5275e6, 6.0e3, 0.04),
+    (2.4400e6, 2.3610e6, 8.0e3, 0.04),
+    (2.5000e6, 2.5000e6, 1.8e5, 0.27),
+]
+# %%-
+
+# %%--  Helpers
+def choice_index(rng, p, n):
+    "Draw n indices with probabilities p [normalised]"
+    p = np.asarray(p, dtype=float)
+    return rng.choice(len(p), size=n, p=p/p.sum())
+
+def choice(rng, spec, n):
+    "Draw n values from a (values, probabilities) specification"
+    values, p = spec
+    return np.asarray(values)[choice_index(rng, p, n)]
+
+def fan_out(rng, n, mean, maximum=8):
+    "Number of child rows per accident, at least 1, with the given mean"
+    return np.minimum(1+rng.poisson(mean-1, n), maximum)
+
+def child_ids(counts):
+    "Position of each child row within its accident [0, 1, 2, ...]"
+    starts = np.repeat(np.cumsum(counts)-counts, counts)
+    return np.arange(counts.sum())-starts
+
+def write(df, path, first):
+    df.to_csv(path, index=False, mode="w" if first else "a", header=first)
+# %%-
+
+# %%--  Tables
+def accident_chunk(rng, start, n):
+    "ACCIDENT rows of accidents start to start+n"
+    accident_no = np.char.add("T", np.char.zfill(np.arange(start, start+n).astype(str), 10))
+    dates = pd.Timestamp("2006-01-01")+pd.to_timedelta(rng.integers(0, 5479, n), unit="D")
+    severity = choice(rng, SEVERITY, n)
+    accident_type = choice_index(rng, ACCIDENT_TYPES[1], n)
+    light = choice(rng, LIGHT_CONDITIONS, n)
+    geometry = choice(rng, ROAD_GEOMETRIES, n)
+    no_vehicles = fan_out(rng, n, VEHICLES_PER_ACCIDENT)
+    persons = fan_out(rng, n, PERSONS_PER_ACCIDENT, maximum=20)
+    killed = np.where(severity == 1, 1+rng.binomial(1, 0.08, n), 0)
+    inj_2 = np.where(severity == 2, 1+rng.binomial(1, 0.2, n), np.where(severity == 1, rng.binomial(1, 0.3, n), 0))
+    inj_3 = np.where(severity == 3, 1+rng.binomial(1, 0.3, n), rng.binomial(1, 0.2, n))
+    not_inj = np.maximum(persons-killed-inj_2-inj_3, 0)
+    df = pd.DataFrame({
+        'ACCIDENT_NO': accident_no,
+        'ACCIDENTDATE': dates.strftime("%d/%m/%Y"),
+        'ACCIDENTTIME': np.char.add(np.char.zfill(rng.integers(0, 24, n).astype(str), 2), ".00.00"),
+        'ACCIDENT_TYPE': accident_type+1,
+        'Accident Type Desc': np.asarray(ACCIDENT_TYPES[0])[accident_type],
+        'DAY_OF_WEEK': (dates.dayofweek+1)%7+1,
+        'Day Week Description': np.asarray(DAYS)[dates.dayofweek],
+        'DCA_CODE': rng.integers(100, 200, n),
+        'DCA Description': "VEHICLES FROM SAME DIRECTION",
+        'DIRECTORY': "MEL",
+        'EDITION': "40",
+        'PAGE': rng.integers(1, 700, n).astype(str),
+        'GRID_REFERENCE_X': np.asarray(list("ABCDEFGHIJK"))[rng.integers(0, 11, n)],
+        'GRID_REFERENCE_Y': rng.integers(1, 12, n),
+        'LIGHT_CONDITION': rng.integers(1, 10, n),
+        'Light Condition Desc': light,
+        'NODE_ID': rng.integers(1, 350000, n),
+        'NO_OF_VEHICLES': no_vehicles,
+        'NO_PERSONS': killed+inj_2+inj_3+not_inj,
+        'NO_PERSONS_INJ_2': inj_2,
+        'NO_PERSONS_INJ_3': inj_3,
+        'NO_PERSONS_KILLED': killed,
+        'NO_PERSONS_NOT_INJ': not_inj,
+        'POLICE_ATTEND': rng.integers(1, 3, n),
+        'ROAD_GEOMETRY': rng.integers(1, 10, n),
+        'Road Geometry Desc': geometry,
+        'SEVERITY': severity,
+        'SPEED_ZONE': choice(rng, SPEED_ZONES, n),
+    })
+    return df
+
+def node_chunk(rng, accident):
+    "NODE rows, mostly one per accident with a few duplicated locations"
+    n = len(accident)
+    counts = 1+rng.binomial(1, 0.01, n)
+    cluster = rng.choice(len(CLUSTERS), size=n, p=[c[3] for c in CLUSTERS])
+    x0, y0, sigma = (np.array([c[i] for c in CLUSTERS])[cluster] for i in range(3))
+    x = x0+rng.normal(0, 1, n)*sigma
+    y = y0+rng.normal(0, 1, n)*sigma
+    df = pd.DataFrame({
+        'ACCIDENT_NO': accident['ACCIDENT_NO'].to_numpy(),
+        'NODE_ID': accident['NODE_ID'].to_numpy(),
+        'NODE_TYPE': np.where(rng.random(n) < 0.5, "I", "N"),
+        'VICGRID94_X': x.round(2),
+        'VICGRID94_Y': y.round(2),
+        'LGA_NAME': np.asarray(LGAS)[rng.integers(0, len(LGAS), n)],
+        'LGA_NAME_ALL': np.asarray(LGAS)[rng.integers(0, len(LGAS), n)],
+        'DEG_URBAN_NAME': np.where(cluster < 2, "MELB_URBAN", "RURAL_VICTORIA"),
+        'Lat': -37.81+(y-2.4098e6)/111e3,
+        'Long': 144.96+(x-2.4965e6)/88e3,
+        'POSTCODE_NO': rng.integers(3000, 3999, n),
+    })
+    return df.loc[df.index.repeat(counts)]
+
+def atmospheric_chunk(rng, accident):
+    "ATMOSPHERIC_COND rows, one or two conditions per accident"
+    n = len(accident)
+    counts = 1+rng.binomial(1, 0.02, n)
+    cond = choice_index(rng, ATMOSPH_CONDS[1], counts.sum())
+    return pd.DataFrame({
+        'ACCIDENT_NO': np.repeat(accident['ACCIDENT_NO'].to_numpy(), counts),
+        'ATMOSPH_COND': cond+1,
+        'ATMOSPH_COND_SEQ': child_ids(counts)+1,
+        'Atmosph Cond Desc': np.asarray(ATMOSPH_CONDS[0])[cond],
+    })
+
+def vehicle_chunk(rng, accident):
+    "VEHICLE rows, NO_OF_VEHICLES per accident identified A, B, C..."
+    counts = accident['NO_OF_VEHICLES'].to_numpy()
+    n = counts.sum()
+    vehicle_type = choice_index(rng, VEHICLE_TYPES[2], n)
+    year = rng.integers(1970, 2021, n).astype(float)
+    year[rng.random(n) < 0.03] = 0
+    year[rng.random(n) < 0.02] = np.nan
+    return pd.DataFrame({
+        'ACCIDENT_NO': np.repeat(accident['ACCIDENT_NO'].to_numpy(), counts),
+        'VEHICLE_ID': np.asarray(list("ABCDEFGHIJ"))[child_ids(counts)],
+        'VEHICLE_YEAR_MANUF': year,
+        'VEHICLE_DCA_CODE': rng.integers(1, 3, n),
+        'INITIAL_DIRECTION': np.asarray(["N", "S", "E", "W"])[rng.integers(0, 4, n)],
+        'ROAD_SURFACE_TYPE': 1,
+        'Road Surface Type Desc': "Paved",
+        'REG_STATE': "V",
+        'VEHICLE_BODY_STYLE': "SEDAN",
+        'VEHICLE_MAKE': np.asarray(MAKES)[np.minimum(rng.zipf(1.6, n), len(MAKES))-1],
+        'VEHICLE_MODEL': "MODEL",
+        'VEHICLE_POWER': np.nan,
+        'VEHICLE_TYPE': np.asarray(VEHICLE_TYPES[0])[vehicle_type],
+        'Vehicle Type Desc': np.asarray(VEHICLE_TYPES[1])[vehicle_type],
+        'VEHICLE_WEIGHT': np.nan,
+        'CONSTRUCTION_TYPE': "R",
+        'FUEL_TYPE': np.asarray(["P", "D", "E", "M"])[rng.integers(0, 4, n)],
+        'NO_OF_WHEELS': 4,
+        'NO_OF_CYLINDERS': 4,
+        'SEATING_CAPACITY': 5,
+        'TARE_WEIGHT': rng.integers(800, 2500, n),
+        'TOTAL_NO_OCCUPANTS': rng.integers(1, 5, n),
+        'CARRY_CAPACITY': np.nan,
+        'CUBIC_CAPACITY': np.nan,
+        'FINAL_DIRECTION': np.asarray(["N", "S", "E", "W"])[rng.integers(0, 4, n)],
+        'DRIVER_INTENT': rng.integers(1, 20, n),
+        'VEHICLE_MOVEMENT': rng.integers(1, 20, n),
+        'TRAILER_TYPE': "H",
+        'VEHICLE_COLOUR_1': "WHI",
+        'VEHICLE_COLOUR_2': "ZZ",
+        'CAUGHT_FIRE': 2,
+        'INITIAL_IMPACT': np.asarray(IMPACTS)[rng.integers(0, len(IMPACTS), n)],
+        'LAMPS': 2,
+        'LEVEL_OF_DAMAGE': rng.integers(1, 7, n),
+        'OWNER_POSTCODE': rng.integers(3000, 3999, n),
+        'TOWED_AWAY_FLAG': rng.integers(1, 3, n),
+        'TRAFFIC_CONTROL': rng.integers(0, 12, n),
+        'Traffic Control Desc': "No control",
+    })
+
+def person_chunk(rng, accident):
+    "PERSON rows, NO_PERSONS per accident with injury levels matching the accident counts"
+    counts = accident['NO_PERSONS'].to_numpy()
+    n = counts.sum()
+    level_counts = accident[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','NO_PERSONS_INJ_3','NO_PERSONS_NOT_INJ']].to_numpy()
+    levels = np.repeat(np.tile(INJ_LEVELS[0], len(accident)), level_counts.ravel())
+    vehicles = accident['NO_OF_VEHICLES'].to_numpy()
+    return pd.DataFrame({
+        'ACCIDENT_NO': np.repeat(accident['ACCIDENT_NO'].to_numpy(), counts),
+        'PERSON_ID': np.char.zfill((child_ids(counts)+1).astype(str), 2),
+        'VEHICLE_ID': np.asarray(list("ABCDEFGHIJ"))[rng.integers(0, 1 << 30, n) % np.repeat(vehicles, counts)],
+        'SEX': np.asarray(["M", "F", "U"])[rng.choice(3, n, p=[0.55, 0.43, 0.02])],
+        'AGE': rng.integers(0, 95, n),
+        'Age Group': "26-29",
+        'INJ_LEVEL': levels,
+        'Inj Level Desc': np.asarray(INJ_LEVELS[1])[levels-1],
+        'SEATING_POSITION': "D",
+        'HELMET_BELT_WORN': rng.integers(1, 10, n),
+        'ROAD_USER_TYPE': rng.integers(1, 10, n),
+        'Road User Type Desc': "Drivers",
+        'LICENCE_STATE': "V",
+        'PEDEST_MOVEMENT': "0",
+        'POSTCODE': rng.integers(3000, 3999, n),
+        'TAKEN_HOSPITAL': np.where(levels < 3, "Y", "N"),
+        'EJECTED_CODE': 0,
+    })
+
+def other_chunk(rng, accident, name):
+    "Minimal rows of the tables not used by the analysis, one per accident"
+    return pd.DataFrame({'ACCIDENT_NO': accident['ACCIDENT_NO'].to_numpy(), name+'_SEQ': 1})
+
+TABLES = {
+    "NODE": node_chunk,
+    "ATMOSPHERIC_COND": atmospheric_chunk,
+    "VEHICLE": vehicle_chunk,
+    "PERSON": person_chunk,
+}
+OTHER_TABLES = ["ACCIDENT_CHAINAGE", "ACCIDENT_EVENT", "ACCIDENT_LOCATION", "NODE_ID_COMPLEX_INT_ID", "SUBDCA"]
+# %%-
+
+# %%--  Generation
+def generate(outdir, scale=1, seed=0, chunk=CHUNK):
+    """Write the ten CrashStats csv files at scale times the real number of accidents.
+
+    Accidents are generated chunk by chunk so 100x extracts fit in memory.
+    Returns the number of rows written per table.
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    total = int(round(ACCIDENTS*scale))
+    rows = {}
+    for start in range(0, total, chunk):
+        first = start == 0
+        accident = accident_chunk(rng, start, min(chunk, total-start))
+        tables = {"ACCIDENT": accident}
+        for name, make in TABLES.items(): tables[name] = make(rng, accident)
+        for name in OTHER_TABLES: tables[name] = other_chunk(rng, accident, name)
+        for name, df in tables.items():
+            write(df, outdir/(name+".csv"), first)
+            rows[name] = rows.get(name, 0)+len(df)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic CrashStats extract")
+    parser.add_argument("outdir", help="Folder where the csv files are written")
+    parser.add_argument("--scale", type=float, default=1, help="Multiple of the real number of accidents [e.g. 1, 10, 100]")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    for name, n in generate(args.outdir, args.scale, args.seed).items(): print("%-24s %12d rows"%(name, n))
+
+if __name__ == "__main__":
+    main()
+# %%-
@@ -0,0 +1,134 @@
+"Memory-mapped numpy column store of the tables, shared between worker processes through the page cache"
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from dataloader import CACHE_FOLDER, FILENAMES, CrashDataset, apply_filters, load_table, source_signature, write_atomic
+from profiling import profiled
+
+# %%--  Settings
+COLUMN_FOLDER = "columns"
+# %%-
+
+# %%--  Encoding
+def code_dtype(ncategories):
+    "Smallest signed integer type holding the codes of ncategories levels, as pandas does"
+    for dtype in (np.int8, np.int16, np.int32):
+        if ncategories < np.iinfo(dtype).max: return dtype
+    return np.int64
+
+def encode_column(series):
+    """Array stored on disk for a column and its description in the store metadata.
+
+    Numeric, boolean and date columns are stored as they are. Categorical and
+    string columns are dictionary-encoded: integer codes on disk [-1 for
+    missing values] and the levels in the metadata.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        codes = series.cat.codes.to_numpy().astype(code_dtype(len(categories)))
+        return codes, {"kind": "category", "categories": categories.tolist(), "ordered": bool(series.cat.ordered)}
+    if series.dtype == object:
+        codes, categories = pd.factorize(series)
+        return codes.astype(code_dtype(len(categories))), {"kind": "string", "categories": categories.tolist()}
+    return series.to_numpy(), {"kind": "values"}
+
+def decode_column(array, meta):
+    """Column built over a memory-mapped array.
+
+    Values and categorical columns reference the mapped pages without copy.
+    String columns are decoded back to objects, which allocates one pointer
+    per row but keeps the source dtype.
+    """
+    if meta["kind"] == "values": return array
+    categories = pd.Index(meta["categories"], dtype=object if meta["kind"] == "string" else None)
+    if meta["kind"] == "category":
+        return pd.Categorical.from_codes(array, dtype=pd.CategoricalDtype(categories, ordered=meta["ordered"]))
+    if len(categories) == 0: return np.full(len(array), np.nan, dtype=object)
+    values = categories.to_numpy().take(array)
+    values[array < 0] = np.nan
+    return values
+# %%-
+
+# %%--  Store handling
+def store_paths(datadir, filename):
+    "Folder of the column files of a table and of its metadata"
+    folder = Path(datadir)/CACHE_FOLDER/COLUMN_FOLDER/filename
+    return folder, folder/"columns.json"
+
+def read_meta(datadir, filename):
+    "Metadata of a stored table, or None when missing or built from another csv"
+    _, meta_path = store_paths(datadir, filename)
+    if not meta_path.exists(): return None
+    with open(meta_path) as f: meta = json.load(f)
+    if meta["signature"] != source_signature(Path(datadir)/(filename+".csv")): return None
+    return meta
+
+@profiled("column_store")
+def build_store(datadir, filename):
+    "Write every column of a cached table to its own npy file"
+    folder, meta_path = store_paths(datadir, filename)
+    folder.mkdir(parents=True, exist_ok=True)
+    df = load_table(datadir, filename)
+    columns = {}
+    for i, col in enumerate(df.columns):
+        array, meta = encode_column(df[col])
+        meta["file"] = "c%d.npy"%i
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f: np.save(f, np.ascontiguousarray(array))
+        write_atomic(folder/meta["file"], write)
+        columns[col] = meta
+    meta = {"signature": source_signature(Path(datadir)/(filename+".csv")), "rows": len(df), "columns": columns}
+    #   Metadata is written last so an interrupted build is rebuilt on the next run
+    write_atomic(meta_path, lambda path: Path(path).write_text(json.dumps(meta)))
+    return meta
+
+def open_columns(datadir, filename, columns=None):
+    "DataFrame over the memory-mapped columns of a table, built if missing or outdated"
+    meta = read_meta(datadir, filename) or build_store(datadir, filename)
+    folder, _ = store_paths(datadir, filename)
+    names = list(meta["columns"]) if columns is None else list(columns)
+    data = {col: decode_column(np.load(folder/meta["columns"][col]["file"], mmap_mode="r"), meta["columns"][col]) for col in names}
+    return pd.DataFrame(data, columns=names, index=pd.RangeIndex(meta["rows"]), copy=False)
+# %%-
+
+# %%--  Memory-mapped dataset
+class ColumnStoreDataset(CrashDataset):
+    """CrashDataset reading from the memory-mapped column store instead of parquet.
+
+    Tables are views on read-only mapped files, so worker processes opening the
+    same store start instantly and share the pages of the OS cache instead of
+    holding a private copy of every table. Rows selected by filters are copied.
+    """
+    def __getitem__(self, filename):
+        if filename not in self._tables:
+            self._tables[filename] = open_columns(self.datadir, filename)
+        return self._tables[filename]
+
+    def prepare(self, filenames=None):
+        "Build the missing or outdated column stores, e.g. before starting worker processes. Returns the ingest throughput of the parsed csv"
+        report = super().prepare(filenames)
+        for filename in filenames or self.filenames:
+            if read_meta(self.datadir, filename) is None: build_store(self.datadir, filename)
+        return report
+
+    @profiled("read")
+    def read(self, filename, columns=None, filters=None):
+        "Requested columns and rows of a table [see CrashDataset.read], read from the mapped columns"
+        if filename in self._tables: return super().read(filename, columns, filters)
+        read_columns = None
+        if columns is not None:
+            columns = list(columns)
+            read_columns = list(dict.fromkeys(columns+[col for col, _, _ in filters or []]))
+        df = open_columns(self.datadir, filename, read_columns)
+        if not filters: return df
+        df = apply_filters(df, filters)
+        if columns is not None: df = df[columns]
+        df.index = pd.RangeIndex(len(df))
+        return df
+
+def open_dataset(datadir, store="parquet", filenames=FILENAMES):
+    "Dataset reading from the parquet cache or from the memory-mapped column store"
+    if store == "columns": return ColumnStoreDataset(datadir, filenames)
+    return CrashDataset(datadir, filenames)
+# %%-
@@ -0,0 +1,81 @@
+"Single pass count and sum cube over categorical dimensions"
+import numpy as np
+import pandas as pd
+from profiling import profiled
+
+# %%--  Settings
+DENSE_LIMIT = 2**22     # Largest number of cells reduced with a dense bincount
+# %%-
+
+# %%--  Cube
+class CategoryCube:
+    """Counts and sums of measures over every combination of the dimensions.
+
+    The frame is scanned once: each dimension is encoded as integer codes, the
+    codes are combined into a single cell index and the measures are reduced
+    with np.bincount. Marginals and filtered marginals are then computed from
+    the occupied cells only, without touching the rows again. Missing values
+    get their own level so they still count in the totals.
+    """
+    @profiled("category_cube")
+    def __init__(self, df, dimensions, measures):
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+
+        #   Encode dimensions, level 0 is reserved for missing values
+        codes, self.levels = [], {}
+        for dim in self.dimensions:
+            dim_codes, uniques = pd.factorize(df[dim], sort=True)
+            codes.append(dim_codes.astype(np.int64)+1)
+            self.levels[dim] = np.asarray(uniques)
+        self.shape = tuple(len(self.levels[dim])+1 for dim in self.dimensions)
+        flat = np.ravel_multi_index(codes, self.shape) if len(df) else np.zeros(0, dtype=np.int64)
+
+        #   Reduce rows into occupied cells
+        size = int(np.prod(self.shape))
+        if size <= DENSE_LIMIT:
+            counts = np.bincount(flat, minlength=size)
+            cells = np.flatnonzero(counts)
+            inverse = None
+            self.counts = counts[cells]
+        else:
+            cells, inverse, self.counts = np.unique(flat, return_inverse=True, return_counts=True)
+        self.sums = {}
+        for measure in self.measures:
+            values = df[measure].to_numpy(dtype=float)
+            if inverse is None:
+                self.sums[measure] = np.bincount(flat, weights=values, minlength=size)[cells]
+            else:
+                self.sums[measure] = np.bincount(inverse, weights=values, minlength=len(cells))
+        self.coords = dict(zip(self.dimensions, np.unravel_index(cells, self.shape)))
+
+    def _cell_mask(self, where):
+        "Mask of the occupied cells matching {dimension: allowed values}"
+        mask = np.ones(len(self.counts), dtype=bool)
+        for dim, values in (where or {}).items():
+            allowed = np.flatnonzero(np.isin(self.levels[dim], np.atleast_1d(values)))+1
+            mask &= np.isin(self.coords[dim], allowed)
+        return mask
+
+    def totals(self, where=None):
+        "Sum of each measure over all cells, missing levels included"
+        mask = self._cell_mask(where)
+        return pd.Series({measure: self.sums[measure][mask].sum() for measure in self.measures})
+
+    def marginal(self, dimension, where=None, dropna=True):
+        """Sums of the measures by level of one dimension.
+
+        Equivalent to df[measures+[dimension]].groupby(dimension).sum().reset_index()
+        for the rows matching where, e.g. where={"YEAR": [2019, 2020]}.
+        """
+        mask = self._cell_mask(where)
+        codes = self.coords[dimension][mask]
+        nlevels = self.shape[self.dimensions.index(dimension)]
+        counts = np.bincount(codes, weights=self.counts[mask], minlength=nlevels)
+        keep = np.flatnonzero(counts)
+        if dropna: keep = keep[keep > 0]
+        df = pd.DataFrame({dimension: [self.levels[dimension][k-1] if k else np.nan for k in keep]})
+        for measure in self.measures:
+            df[measure] = np.bincount(codes, weights=self.sums[measure][mask], minlength=nlevels)[keep]
+        return df
+# %%-
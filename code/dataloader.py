@@ -0,0 +1,257 @@
+"Loads the crash statistics tables through a typed columnar cache"
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+from pathlib import Path
+from profiling import profiled
+from schemas import DATE_FORMAT, NA_MARKERS, arrow_column_types
+
+# %%--  Settings
+FILENAMES = [
+    "ACCIDENT_CHAINAGE",
+    "ACCIDENT_EVENT",
+    "ACCIDENT_LOCATION",
+    "ACCIDENT",
+    "ATMOSPHERIC_COND",
+    "NODE_ID_COMPLEX_INT_ID",
+    "NODE",
+    "PERSON",
+    "SUBDCA",
+    "VEHICLE"
+]
+CACHE_FOLDER = "cache"
+CACHE_VERSION = 3
+DATE_COLUMNS = ["ACCIDENTDATE"]
+INT8_COLUMNS = ["SEVERITY"]
+CATEGORY_SUFFIXES = (" Desc", " Description")
+CATEGORY_MAX_RATIO = 0.5            # Other string columns become categoricals below this ratio of distinct values
+COPY_ON_WRITE = True                # Share unmodified columns between the frames returned by read [pandas >= 1.5], turned on by make_figures
+INGEST_WORKERS = os.cpu_count()     # Tables parsed concurrently when building the cache
+CSV_BLOCK_SIZE = 8*2**20            # Bytes of csv parsed at once by each pyarrow thread
+# %%-
+
+# %%--  Type conversion
+def downcast_integer(series):
+    "Smallest of int16 and int32 holding the values, never below int16 so adding two counts cannot overflow"
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if len(series) == 0 or (series.min() >= info.min and series.max() <= info.max): return series.astype(dtype)
+    return series
+
+def optimise_dtypes(df):
+    """Convert description and repeated string columns to categoricals, severity to int8,
+    other integers to the smallest safe type and dates to datetime.
+
+    Floats are kept in float64: the VICGRID94 coordinates need its precision.
+    """
+    for col in df.columns:
+        if col.endswith(CATEGORY_SUFFIXES):
+            df[col] = df[col].astype("category")
+        elif col in INT8_COLUMNS:
+            df[col] = df[col].astype(np.int8)
+        elif col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], dayfirst=True)
+        elif df[col].dtype == np.int64:
+            df[col] = downcast_integer(df[col])
+        elif df[col].dtype == object and df[col].nunique() <= CATEGORY_MAX_RATIO*len(df):
+            df[col] = df[col].astype("category")
+    return df
+
+def enable_copy_on_write(enabled=COPY_ON_WRITE):
+    """Turn on pandas copy-on-write where available, so projections and filters share memory until modified.
+
+    This is a process-wide pandas option: it is set by the entry points, never
+    on import, and returns whether copy-on-write is on.
+    """
+    try:
+        pd.set_option("mode.copy_on_write", enabled)
+    except KeyError:
+        return False
+    return enabled
+# %%-
+
+# %%--  Cache handling
+def source_signature(csv_path):
+    "Signature of the source csv used to decide when the cached table must be rebuilt"
+    stat = Path(csv_path).stat()
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "version": CACHE_VERSION}
+
+def cache_paths(datadir, filename):
+    "Path of the cached table and of its signature file"
+    cachedir = Path(datadir)/CACHE_FOLDER
+    return cachedir/(filename+".parquet"), cachedir/(filename+".json")
+
+def is_cache_valid(datadir, filename):
+    "True if the cached table exists and matches the current source csv"
+    table_path, meta_path = cache_paths(datadir, filename)
+    if not table_path.exists() or not meta_path.exists(): return False
+    with open(meta_path) as f: meta = json.load(f)
+    return meta == source_signature(Path(datadir)/(filename+".csv"))
+
+def write_atomic(path, write):
+    "Write through a temporary file renamed at the end, so concurrent readers never see a partial file"
+    tmp_path = Path(path).with_name(Path(path).name+".%d.tmp"%os.getpid())
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def mark_missing(df, filename):
+    "Replace the values standing for unknown [e.g. VEHICLE_YEAR_MANUF 0] by missing values"
+    for col, markers in NA_MARKERS.get(filename, {}).items():
+        if col in df.columns: df[col] = df[col].mask(df[col].isin(markers))
+    return df
+
+def parse_csv(csv_path, filename):
+    """Parse a source csv with the declared schema of its table.
+
+    The file is split in blocks parsed in parallel by pyarrow. Columns outside
+    the schema are inferred, and every column is then typed by optimise_dtypes.
+    A file that does not match its schema [e.g. text in an integer column of a
+    new release] is parsed again with type inference by pandas.
+    """
+    try:
+        table = pv.read_csv(
+            csv_path,
+            read_options=pv.ReadOptions(block_size=CSV_BLOCK_SIZE, use_threads=True),
+            convert_options=pv.ConvertOptions(column_types=arrow_column_types(filename), timestamp_parsers=[DATE_FORMAT], strings_can_be_null=True),
+        )
+    except pa.ArrowInvalid:
+        df = pd.read_csv(csv_path, low_memory=False)
+    else:
+        #   Empty columns are read as nulls, which pandas infers as floats
+        for i, field in enumerate(table.schema):
+            if pa.types.is_null(field.type): table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+        df = table.to_pandas()
+        #   Dictionaries are in order of appearance, pandas categoricals are sorted
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype): df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return mark_missing(optimise_dtypes(df), filename)
+
+@profiled("csv_parse")
+def build_cache(datadir, filename):
+    "Parse the source csv once and store it as a typed parquet table"
+    csv_path = Path(datadir)/(filename+".csv")
+    table_path, meta_path = cache_paths(datadir, filename)
+    table_path.parent.mkdir(parents=True, exist_ok=True)
+    df = parse_csv(csv_path, filename)
+    write_atomic(table_path, lambda path: df.to_parquet(path, index=False))
+    #   Signature is written last so an interrupted build is rebuilt on the next run
+    write_atomic(meta_path, lambda path: Path(path).write_text(json.dumps(source_signature(csv_path))))
+    return df
+
+def ingest(datadir, filenames=FILENAMES, workers=INGEST_WORKERS):
+    """Build the cached tables of several source csv files concurrently.
+
+    Returns the throughput of every table as dictionaries of table, rows,
+    seconds, rows_per_second and mb_per_second, in the order of filenames.
+    """
+    def timed_build(filename):
+        start = time.perf_counter()
+        df = build_cache(datadir, filename)
+        seconds = time.perf_counter()-start
+        size = (Path(datadir)/(filename+".csv")).stat().st_size/2**20
+        return {"table": filename, "rows": len(df), "seconds": seconds, "rows_per_second": len(df)/seconds, "mb_per_second": size/seconds}
+    filenames = list(filenames)
+    if not filenames: return []
+    with ThreadPoolExecutor(max_workers=max(min(workers or 1, len(filenames)), 1)) as pool:
+        return list(pool.map(timed_build, filenames))
+# %%-
+
+# %%--  Loading
+def load_table(datadir, filename):
+    "Load one table from the cache, rebuilding it if the source csv changed"
+    if is_cache_valid(datadir, filename):
+        return pd.read_parquet(cache_paths(datadir, filename)[0])
+    return build_cache(datadir, filename)
+# %%-
+
+# %%--  Lazy dataset
+FILTER_OPERATORS = {
+    "==": lambda s, v: s == v,
+    "=": lambda s, v: s == v,
+    "!=": lambda s, v: s != v,
+    "<": lambda s, v: s < v,
+    "<=": lambda s, v: s <= v,
+    ">": lambda s, v: s > v,
+    ">=": lambda s, v: s >= v,
+    "in": lambda s, v: s.isin(v),
+    "not in": lambda s, v: ~s.isin(v),
+}
+
+def filter_mask(df, filters):
+    "Boolean mask of the rows of an in-memory table matching a list of (column, operator, value) filters"
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in filters:
+        mask &= FILTER_OPERATORS[op](df[col], value).to_numpy()
+    return mask
+
+def apply_filters(df, filters):
+    "Apply a list of (column, operator, value) filters to an in-memory table"
+    return df.loc[filter_mask(df, filters)]
+
+def select(df, columns=None, filters=None):
+    "Requested columns and rows of an in-memory table, numbered from 0, that can be modified without changing df"
+    #   Project before selecting rows so only the requested columns are copied
+    mask = filter_mask(df, filters) if filters else slice(None)
+    df = df.loc[mask, list(columns) if columns is not None else slice(None)]
+    #   Projections and filters already return new frames, the whole table is returned as itself and must be copied
+    if columns is None and not filters: df = df.copy()
+    df.index = pd.RangeIndex(len(df))
+    return df
+
+class CrashDataset:
+    "Lazy replacement of dfs_dic. Tables are only read when first accessed"
+    def __init__(self, datadir, filenames=FILENAMES):
+        self.datadir = datadir
+        self.filenames = list(filenames)
+        self._tables = {}
+
+    def __getitem__(self, filename):
+        "Full table, read once and kept in memory"
+        if filename not in self._tables:
+            self._tables[filename] = load_table(self.datadir, filename)
+        return self._tables[filename]
+
+    def __contains__(self, filename):
+        return filename in self.filenames
+
+    def keys(self):
+        return list(self.filenames)
+
+    def prepare(self, filenames=None):
+        "Build the missing or outdated cached tables, e.g. before starting worker processes. Returns their ingest throughput"
+        stale = [filename for filename in filenames or self.filenames if not is_cache_valid(self.datadir, filename)]
+        return ingest(self.datadir, stale)
+
+    def loaded(self):
+        "Names of the tables currently held in memory"
+        return list(self._tables)
+
+    @profiled("read")
+    def read(self, filename, columns=None, filters=None):
+        """Read only the requested columns and rows of a table.
+
+        filters is a list of (column, operator, value) tuples combined with AND,
+        e.g. [("SEVERITY", "<", 3)]. Filters and column selection are pushed down
+        to the parquet reader unless the full table is already in memory.
+        """
+        if columns is not None: columns = list(columns)
+        if filename in self._tables: return select(self._tables[filename], columns, filters)
+        if not is_cache_valid(self.datadir, filename): build_cache(self.datadir, filename)
+        #   Filter columns must be read even if not requested
+        read_columns = columns
+        if columns is not None and filters:
+            read_columns = list(dict.fromkeys(columns+[col for col, _, _ in filters]))
+        df = pd.read_parquet(
+            cache_paths(self.datadir, filename)[0],
+            columns=read_columns,
+            filters=[tuple(f) for f in filters] if filters else None,
+        )
+        if read_columns is not columns: df = df[columns]
+        df.index = pd.RangeIndex(len(df))
+        return df
+# %%-
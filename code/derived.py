@@ -0,0 +1,125 @@
+"Derived tables shared between sections, memoized per process and cached on disk"
+import functools
+import hashlib
+import json
+import pandas as pd
+from pathlib import Path
+from dataloader import CACHE_FOLDER, select, source_signature, write_atomic
+from features import valid_year_manuf, vehicle_age
+from keyindex import key_index
+from spatial import clear_indexes
+from stats import bootstrap_ci
+from streaming import StreamingJoin, iter_chunks
+from profiling import profiled
+
+# %%--  Settings
+DERIVED_FOLDER = "derived"
+FEATURES_VERSION = 1                # Increase when the accident features change, so every extract rebuilds them and the tables derived from them
+FEATURE_TABLES = ["ACCIDENT", "ATMOSPHERIC_COND", "VEHICLE", "NODE"]
+FEATURE_ACCIDENT_COLUMNS = [
+    'ACCIDENT_NO', 'ACCIDENTDATE', 'SEVERITY', 'SPEED_ZONE', 'Day Week Description', 'Accident Type Desc',
+    'Light Condition Desc', 'Road Geometry Desc', 'NO_PERSONS', 'NO_PERSONS_KILLED', 'NO_PERSONS_INJ_2',
+    'NO_PERSONS_INJ_3', 'NO_PERSONS_NOT_INJ',
+]
+FEATURE_VEHICLE_COLUMNS = ['VEHICLE_TYPE', 'Vehicle Type Desc', 'VEHICLE_MAKE', 'INITIAL_IMPACT', 'VEHICLE_YEAR_MANUF']
+_MEMORY = {}
+# %%-
+
+# %%--  Cache layer
+def input_hash(ds, name, tables, version, params):
+    "Hash of everything a derived table depends on: source tables, version and parameters"
+    key = {
+        "name": name,
+        "version": version,
+        "params": params,
+        "tables": {table: source_signature(Path(ds.datadir)/(table+".csv")) for table in tables},
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def derived_table(tables, version=1):
+    """Decorator for functions building a table from a CrashDataset.
+
+    The result is computed once per process and stored as parquet in
+    data/cache/derived, keyed by a hash of the source tables signatures, the
+    version and the keyword parameters. Returned frames are shared between
+    callers and must not be modified in place.
+    """
+    def decorator(func):
+        build = profiled(func.__name__)(func)
+        @functools.wraps(func)
+        def wrapper(ds, **params):
+            key = input_hash(ds, func.__name__, tables, version, params)
+            memory_key = (str(ds.datadir), key)
+            if memory_key in _MEMORY: return _MEMORY[memory_key]
+            path = Path(ds.datadir)/CACHE_FOLDER/DERIVED_FOLDER/(func.__name__+"-"+key+".parquet")
+            if path.exists():
+                df = pd.read_parquet(path)
+            else:
+                df = build(ds, **params)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                write_atomic(path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+            _MEMORY[memory_key] = df
+            return df
+        return wrapper
+    return decorator
+
+def clear_memory():
+    "Forget the derived tables held by this process and the grid indexes built on them"
+    _MEMORY.clear()
+    clear_indexes()
+# %%-
+
+# %%--  Accident features
+@derived_table(tables=FEATURE_TABLES, version=FEATURES_VERSION)
+def accident_features(ds):
+    """One row per accident with everything the sections used to join from the other tables.
+
+    Holds the ACCIDENT categories and person counts by severity, the first
+    atmospheric condition [ATMOSPH_COND_SEQ 1], the attributes of vehicle A,
+    the first NODE location and VEHICLE_AGE, the age of vehicle A at the
+    accident. Values are missing where an accident has no such row.
+    """
+    index = key_index(ds)
+    df = ds.read("ACCIDENT", columns=FEATURE_ACCIDENT_COLUMNS)
+
+    atmosph = ds.read('ATMOSPHERIC_COND', columns=['ATMOSPH_COND_SEQ','Atmosph Cond Desc'])
+    df = index.join_first(df, 'ATMOSPHERIC_COND', atmosph[['Atmosph Cond Desc']], where=atmosph['ATMOSPH_COND_SEQ']==1)
+
+    #   VEHICLE is the largest table joined here, its vehicle A rows are folded chunk by chunk
+    chunks = iter_chunks(ds, 'VEHICLE', columns=['ACCIDENT_NO']+FEATURE_VEHICLE_COLUMNS, filters=[("VEHICLE_ID","==","A")])
+    df = df.join(StreamingJoin(df[['ACCIDENT_NO']]).first(chunks), on='ACCIDENT_NO')
+
+    df = index.join_first(df, 'NODE', ds.read('NODE', columns=['VICGRID94_X','VICGRID94_Y']))
+
+    year_manuf = df['VEHICLE_YEAR_MANUF'].where(valid_year_manuf(df['VEHICLE_YEAR_MANUF']))
+    df['VEHICLE_AGE'] = vehicle_age(df['ACCIDENTDATE'], year_manuf)
+    return df
+
+@profiled("read_features")
+def read_features(ds, columns=None, filters=None):
+    "Requested columns and rows of the accident features, filters as in CrashDataset.read"
+    return select(accident_features(ds), columns, filters)
+# %%-
+
+# %%--  Derived tables
+@derived_table(tables=FEATURE_TABLES, version=(2, FEATURES_VERSION))
+def serious_accident_nodes(ds):
+    "Fatal and serious injury accidents [Severity 1 or 2] with their first NODE location"
+    df = read_features(ds, columns=['ACCIDENT_NO','SEVERITY','NO_PERSONS_KILLED','NO_PERSONS_INJ_2','VICGRID94_X','VICGRID94_Y'], filters=[("SEVERITY","<",3)])
+    df['TOTAL_INJURY'] = df['NO_PERSONS_KILLED'] + df['NO_PERSONS_INJ_2']
+
+    #   Convert to injury rate percentage
+    df['TOTAL_INJURY'] = df['TOTAL_INJURY']/df['TOTAL_INJURY'].sum()*100
+    return df
+
+@derived_table(tables=["ACCIDENT"])
+def monthly_injury_ci(ds, measure='NO_PERSONS_KILLED', start=None, end=None):
+    "Monthly totals of a person count with their bootstrap confidence interval, resampling the accidents of each month"
+    filters = []
+    if start is not None: filters.append(("ACCIDENTDATE", ">=", pd.Timestamp(start)))
+    if end is not None: filters.append(("ACCIDENTDATE", "<=", pd.Timestamp(end)))
+    df = ds.read("ACCIDENT", columns=['ACCIDENTDATE', measure], filters=filters)
+    month = df['ACCIDENTDATE'].dt.to_period('M').dt.end_time.dt.normalize().rename('ACCIDENTDATE')
+    df = bootstrap_ci(df[measure], month, estimator="sum")
+    return df.reset_index()
+# %%-
@@ -0,0 +1,64 @@
+"Vectorised derived features of the accidents, vehicles and persons"
+import numpy as np
+import pandas as pd
+
+# %%--  Settings
+INJ_LEVELS = {
+    1: 'PERSONS_KILLED',
+    2: 'PERSONS_INJ_2',
+    3: 'PERSONS_INJ_3',
+    4: 'PERSONS_NOT_INJ',
+}
+# %%-
+
+# %%--  Date features
+def accident_year(date):
+    "Year of the accident"
+    return date.dt.year.astype(np.int16)
+
+def accident_month(date):
+    "Month of the accident [1-12]"
+    return date.dt.month.astype(np.int8)
+
+def day_of_week_code(date):
+    "Day of the week of the accident [Monday=0, Sunday=6]"
+    return date.dt.dayofweek.astype(np.int8)
+
+def add_date_features(df, col='ACCIDENTDATE'):
+    "Add YEAR, MONTH and DAY_OF_WEEK columns computed from the accident date"
+    return df.assign(
+        YEAR=accident_year(df[col]),
+        MONTH=accident_month(df[col]),
+        DAY_OF_WEEK=day_of_week_code(df[col]),
+    )
+# %%-
+
+# %%--  Vehicle features
+def valid_year_manuf(year_manuf):
+    "Mask of the known manufacturing years [missing values and the 0 sentinel are unknown]"
+    return year_manuf.notna().to_numpy() & (year_manuf.to_numpy() != 0)
+
+def vehicle_age(date, year_manuf):
+    "Age of the vehicle at the accident in years [accident year - manufacturing year]"
+    return date.dt.year.to_numpy()-year_manuf.to_numpy()
+# %%-
+
+# %%--  Person features
+def person_severity_counts(person):
+    """Number of persons of each injury level per accident.
+
+    person needs the ACCIDENT_NO and INJ_LEVEL columns of the PERSON table.
+    Returns one row per ACCIDENT_NO with a column per level of INJ_LEVELS.
+    """
+    codes, accidents = pd.factorize(person['ACCIDENT_NO'])
+    levels = person['INJ_LEVEL'].to_numpy()
+    known = (codes >= 0) & np.isin(levels, list(INJ_LEVELS))
+    nlevels = max(INJ_LEVELS)+1
+    counts = np.bincount(
+        codes[known]*nlevels+levels[known].astype(np.int64),
+        minlength=len(accidents)*nlevels,
+    ).reshape(len(accidents), nlevels)
+    df = pd.DataFrame(counts[:, list(INJ_LEVELS)], columns=list(INJ_LEVELS.values()))
+    df.insert(0, 'ACCIDENT_NO', np.asarray(accidents))
+    return df
+# %%-
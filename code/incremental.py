@@ -0,0 +1,154 @@
+"Incremental update of the persisted aggregates from a new CrashStats extract"
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from dataloader import CACHE_FOLDER, write_atomic
+from derived import read_features
+
+# %%--  Settings
+STORE_FOLDER = "incremental"
+MONTHLY_MEASURES = ['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','NO_PERSONS_INJ_3','NO_PERSONS_NOT_INJ']
+CATEGORY_MEASURES = ['NO_PERSONS_KILLED','NO_PERSONS_INJ_2']
+CATEGORY_DIMS = ['SPEED_ZONE', 'Day Week Description', 'Accident Type Desc', 'Light Condition Desc', 'Road Geometry Desc', 'Atmosph Cond Desc']
+_STORES = {}
+# %%-
+
+# %%--  Ledger
+def accident_ledger(ds):
+    """One row per accident with everything the aggregates depend on and a hash of it.
+
+    Category sums only count fatal and serious injury accidents [Severity 1 or 2],
+    with their first atmospheric condition read from the accident features as in
+    section A2.
+    """
+    df = read_features(ds, columns=['ACCIDENT_NO','ACCIDENTDATE','SEVERITY']+MONTHLY_MEASURES+CATEGORY_DIMS)
+    df.drop_duplicates(subset=['ACCIDENT_NO'], inplace=True)
+
+    #   Month buckets are labelled by their last day, as pd.Grouper(freq='M')
+    df['MONTH'] = df['ACCIDENTDATE'].dt.to_period('M').dt.end_time.dt.normalize()
+    for dim in CATEGORY_DIMS: df[dim] = df[dim].astype(object)
+    df = df[['ACCIDENT_NO','MONTH','SEVERITY']+MONTHLY_MEASURES+CATEGORY_DIMS]
+    df['ROW_HASH'] = pd.util.hash_pandas_object(df.drop(columns='ACCIDENT_NO'), index=False).to_numpy()
+    return df.reset_index(drop=True)
+
+def monthly_sums(ledger, sign=1):
+    "Monthly sums of the measures and accident counts of the ledger rows"
+    df = ledger.groupby('MONTH')[MONTHLY_MEASURES].sum().astype(float)*sign
+    df['ACCIDENTS'] = ledger.groupby('MONTH').size()*sign
+    return df
+
+def category_sums(ledger, dim, sign=1):
+    "Sums of the serious injury measures by level of one dimension, missing level included"
+    serious = ledger.loc[ledger['SEVERITY']<3]
+    groups = serious.groupby(dim, dropna=False)
+    df = groups[CATEGORY_MEASURES].sum().astype(float)*sign
+    df['ACCIDENTS'] = groups.size()*sign
+    return df
+# %%-
+
+# %%--  Store
+class IncrementalStore:
+    """Persisted ledger and aggregates updated from the accidents that changed.
+
+    update(ds) hashes every accident of the current extract and diffs it with
+    the stored ledger by ACCIDENT_NO. The contributions of removed and changed
+    accidents are subtracted and those of added and changed accidents added,
+    so only the affected month buckets and category levels are touched.
+    marginal and totals mirror CategoryCube for section A2.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.ledger = None
+        self.monthly = None
+        self.categories = {}
+        self._load()
+
+    def _files(self):
+        files = {"ledger": self.path/"ledger.parquet", "monthly": self.path/"monthly.parquet"}
+        for i, dim in enumerate(CATEGORY_DIMS): files[dim] = self.path/("category_%d.parquet"%i)
+        return files
+
+    def _load(self):
+        files = self._files()
+        if not all(path.exists() for path in files.values()): return
+        self.ledger = pd.read_parquet(files["ledger"])
+        self.monthly = pd.read_parquet(files["monthly"]).set_index('MONTH')
+        for dim in CATEGORY_DIMS:
+            self.categories[dim] = pd.read_parquet(files[dim]).set_index(dim)
+
+    def _save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        files = self._files()
+        frames = {"ledger": self.ledger, "monthly": self.monthly.reset_index()}
+        for dim in CATEGORY_DIMS: frames[dim] = self.categories[dim].reset_index()
+        #   Ledger is written last so an interrupted save triggers a full rebuild
+        for key in list(files)[1:]+["ledger"]:
+            write_atomic(files[key], lambda path: frames[key].to_parquet(path, index=False))
+
+    def _rebuild(self, ledger):
+        self.ledger = ledger
+        self.monthly = monthly_sums(ledger)
+        self.categories = {dim: category_sums(ledger, dim) for dim in CATEGORY_DIMS}
+
+    def update(self, ds):
+        "Apply the accidents added, changed or removed since the stored extract. Returns a summary"
+        ledger = accident_ledger(ds)
+        if self.ledger is None:
+            self._rebuild(ledger)
+            self._save()
+            return {"added": len(ledger), "changed": 0, "removed": 0, "months": len(self.monthly), "rebuilt": True}
+
+        #   Diff by ACCIDENT_NO
+        diff = pd.merge(
+            self.ledger[['ACCIDENT_NO','ROW_HASH']], ledger[['ACCIDENT_NO','ROW_HASH']],
+            how="outer", on="ACCIDENT_NO", suffixes=("_OLD", "_NEW"), indicator=True,
+        )
+        changed = diff.loc[(diff['_merge']=="both") & (diff['ROW_HASH_OLD']!=diff['ROW_HASH_NEW']), 'ACCIDENT_NO']
+        removed = diff.loc[diff['_merge']=="left_only", 'ACCIDENT_NO']
+        added = diff.loc[diff['_merge']=="right_only", 'ACCIDENT_NO']
+        old_rows = self.ledger.loc[self.ledger['ACCIDENT_NO'].isin(pd.concat([changed, removed]))]
+        new_rows = ledger.loc[ledger['ACCIDENT_NO'].isin(pd.concat([changed, added]))]
+
+        #   Apply the deltas to the affected buckets only
+        delta = monthly_sums(new_rows).add(monthly_sums(old_rows, sign=-1), fill_value=0)
+        self.monthly = self.monthly.add(delta, fill_value=0)
+        self.monthly = self.monthly.loc[self.monthly['ACCIDENTS']!=0]
+        for dim in CATEGORY_DIMS:
+            dim_delta = category_sums(new_rows, dim).add(category_sums(old_rows, dim, sign=-1), fill_value=0)
+            categories = self.categories[dim].add(dim_delta, fill_value=0)
+            self.categories[dim] = categories.loc[categories['ACCIDENTS']!=0]
+
+        self.ledger = ledger
+        if len(old_rows) or len(new_rows): self._save()
+        return {"added": len(added), "changed": len(changed), "removed": len(removed), "months": len(delta), "rebuilt": False}
+
+    def monthly_frame(self):
+        "Monthly sums with every month of the range, as groupby(pd.Grouper(key='ACCIDENTDATE', freq='M')).sum()"
+        df = self.monthly.sort_index()
+        months = pd.date_range(df.index.min(), df.index.max(), freq='M')
+        df = df.reindex(months, fill_value=0)[MONTHLY_MEASURES].astype(np.int64)
+        df.index.name = 'ACCIDENTDATE'
+        return df.reset_index()
+
+    def totals(self):
+        "Sum of the serious injury measures over all serious accidents"
+        return self.categories[CATEGORY_DIMS[0]][CATEGORY_MEASURES].sum()
+
+    def marginal(self, dimension, dropna=True):
+        "Sums of the serious injury measures by level of one dimension, sorted by level"
+        df = self.categories[dimension][CATEGORY_MEASURES]
+        if dropna: df = df.loc[df.index.notna()]
+        return df.sort_index().reset_index()
+# %%-
+
+# %%--  Shared store
+def incremental_store(ds, path=None):
+    "Store of the dataset, brought up to date with the current extract once per process"
+    path = Path(path or Path(ds.datadir)/CACHE_FOLDER/STORE_FOLDER)
+    if path not in _STORES:
+        store = IncrementalStore(path)
+        print("Incremental update: "+json.dumps(store.update(ds)))
+        _STORES[path] = store
+    return _STORES[path]
+# %%-
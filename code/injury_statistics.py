@@ -4,9 +4,16 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import seaborn as sns
-import datetime
 from pathlib import Path
 from matplotlibstyle import *
+from dataloader import CrashDataset
+from cube import CategoryCube
+from incremental import incremental_store
+from features import valid_year_manuf
+from derived import monthly_injury_ci, read_features
+from stats import poisson_ci, total_ci
+from rollups import date_filters, monthly_series
+from jobs import figure_job, run_job
 # %%-
 
 # %%--  Settings
@@ -14,24 +21,34 @@ DIR = Path(__file__).parent.parent
 DATADIR = str(DIR/'data')
 FIGDIR = str(DIR/'figures')
 SAVE = True
+INCREMENTAL = False                 # Update persisted A1 and A2 aggregates from the changed accidents only
+DATE_RANGE = (None, None)           # Inclusive (start, end) accident dates of the sections, e.g. ("2015-01-01", "2019-12-31")
 # %%-
 
 # %%--  Data loading
-filenames = [
-    "ACCIDENT_CHAINAGE",
-    "ACCIDENT_EVENT",
-    "ACCIDENT_LOCATION",
-    "ACCIDENT",
-    "ATMOSPHERIC_COND",
-    "NODE_ID_COMPLEX_INT_ID",
-    "NODE",
-    "PERSON",
-    "SUBDCA",
-    "VEHICLE"
-]
-dfs_dic = {}
-for filename in filenames:
-    dfs_dic[filename] = pd.read_csv(DATADIR+"\\"+filename+".csv")
+ds = CrashDataset(DATADIR)
+# %%-
+
+# %%--  Confidence intervals
+def add_total_ci(df, x, rows, measures):
+    "Merge the low and high Student t interval of the category totals of the accident rows into a melted marginal"
+    ci = total_ci(rows, x, measures)[[x,'measure','low','high']].rename(columns={'measure':'Injury level'})
+    ci[x] = ci[x].astype(df[x].dtype)
+    return pd.merge(df, ci, how="left", on=[x,'Injury level'])
+
+def draw_intervals(ax, df, x, y='Number of persons [%]'):
+    "Draw the precomputed low and high columns of df as error bars on the bars of a hue barplot"
+    labels = [label.get_text() for label in ax.get_xticklabels()]
+    for bars in list(ax.containers):
+        level = df.loc[df['Injury level']==bars.get_label()]
+        level = level.set_index(level[x].astype(str)).reindex(labels)
+        centers = [bar.get_x()+bar.get_width()/2 for bar in bars]
+        ax.errorbar(centers, level[y], yerr=[level[y]-level['low'], level['high']-level[y]], fmt='none', ecolor='k', elinewidth=1, capsize=2)
+
+def draw_empty(ax, xlabel):
+    "Label an axis left without bars, when DATE_RANGE holds no accident"
+    ax.text(0.5, 0.5, "No accidents", ha='center', va='center', transform=ax.transAxes)
+    ax.set_xlabel(xlabel)
 # %%-
 
 #\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
@@ -39,290 +56,325 @@ for filename in filenames:
 #///////////////////////////////////////////////////////////////////////////////
 
 # %%--  0-Base statistics
-A0_df = dfs_dic["ACCIDENT"]
-
-#   Injury rate
-print("Accident mortality rate: %.2F %%"%(A0_df["NO_PERSONS_KILLED"].sum()/A0_df["NO_PERSONS"].sum()*100))
-print("Accident serious injury rate: %.2F %%"%(A0_df["NO_PERSONS_INJ_2"].sum()/A0_df["NO_PERSONS"].sum()*100))
-print("Accident minor injury rate: %.2F %%"%(A0_df["NO_PERSONS_INJ_3"].sum()/A0_df["NO_PERSONS"].sum()*100))
-print("Accident no injury rate: %.2F %%"%(A0_df["NO_PERSONS_NOT_INJ"].sum()/A0_df["NO_PERSONS"].sum()*100))
-
+def A0_data(ds):
+    A0_df = ds.read("ACCIDENT", columns=["NO_PERSONS","NO_PERSONS_KILLED","NO_PERSONS_INJ_2","NO_PERSONS_INJ_3","NO_PERSONS_NOT_INJ"], filters=date_filters(*DATE_RANGE))
+    return A0_df.sum()
+
+def A0_report(A0_sums):
+    if A0_sums["NO_PERSONS"] == 0:
+        print("No accidents in the date range")
+        return
+
+    #   Injury rate
+    print("Accident mortality rate: %.2F %%"%(A0_sums["NO_PERSONS_KILLED"]/A0_sums["NO_PERSONS"]*100))
+    print("Accident serious injury rate: %.2F %%"%(A0_sums["NO_PERSONS_INJ_2"]/A0_sums["NO_PERSONS"]*100))
+    print("Accident minor injury rate: %.2F %%"%(A0_sums["NO_PERSONS_INJ_3"]/A0_sums["NO_PERSONS"]*100))
+    print("Accident no injury rate: %.2F %%"%(A0_sums["NO_PERSONS_NOT_INJ"]/A0_sums["NO_PERSONS"]*100))
+
+figure_job("A0", "Base statistics", A0_data, report=A0_report)
+if __name__ == "__main__": run_job("A0", ds, FIGDIR, save=SAVE, show=True)
 # %%-
 
 # %%--  1-Mortality and injury over time
-#   Reshape dataframe for plot
-A1_df = dfs_dic["ACCIDENT"][['ACCIDENTDATE','NO_PERSONS_KILLED','NO_PERSONS_INJ_2','NO_PERSONS_INJ_3','NO_PERSONS_NOT_INJ']].copy(deep=True)
-A1_df['ACCIDENTDATE']=pd.to_datetime(A1_df['ACCIDENTDATE'],infer_datetime_format=True)
-A1_df = A1_df.groupby([pd.Grouper(key='ACCIDENTDATE',freq='M')]).sum()
-A1_df.reset_index(inplace=True)
-A1_df = A1_df.melt(id_vars='ACCIDENTDATE',var_name='Injury level',value_name='Number of persons')
-A1_df.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury','NO_PERSONS_INJ_3':'Minor injury','NO_PERSONS_NOT_INJ':'No injury'}}, inplace=True)
-A1_df=A1_df.loc[A1_df['Injury level']=='Killed']
-#   Plot
-figname = "Injury over time"
-fig = plt.figure(figsize=(10,6))
-ax = plt.gca()
-sns.lineplot(
-    x='ACCIDENTDATE',
-    y='Number of persons',
-    hue='Injury level',
-    style='Injury level',
-    data=A1_df,
-    estimator='mean',
-    ci=95,
-    ax=ax,
-    err_style='band',
-    markers=True,
-    dashes=False,
-    legend=True,
-)
-ax.set_xlabel('Date')
-ax.set_title(figname, fontsize=18, y=1.1)
-ax.tick_params(axis='x',labelrotation=45)
-ax.legend(ncol=4,bbox_to_anchor=(0.5,1.05), loc='center', borderaxespad=0.,frameon=False)
-plt.tight_layout()
-if SAVE: plt.savefig(FIGDIR+"\\"+datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png",transparent=True,bbox_inches='tight')
-plt.show()
+def A1_data(ds):
+    #   Reshape dataframe for plot
+    if INCREMENTAL and DATE_RANGE == (None, None):
+        A1_df = incremental_store(ds).monthly_frame()
+    else:
+        #   Monthly sums from the persisted rollup, partial months at the edges of the range from the accidents
+        A1_df = monthly_series(ds, *DATE_RANGE)[['ACCIDENTDATE','NO_PERSONS_KILLED','NO_PERSONS_INJ_2','NO_PERSONS_INJ_3','NO_PERSONS_NOT_INJ']]
+    A1_df = A1_df.melt(id_vars='ACCIDENTDATE',var_name='Injury level',value_name='Number of persons')
+    A1_df.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury','NO_PERSONS_INJ_3':'Minor injury','NO_PERSONS_NOT_INJ':'No injury'}}, inplace=True)
+    A1_df=A1_df.loc[A1_df['Injury level']=='Killed']
+
+    #   95% confidence band of the monthly totals, computed once here instead of by seaborn at every draw
+    if INCREMENTAL and DATE_RANGE == (None, None):
+        #   Persisted sums have no accident rows to resample, use the exact Poisson interval of the counts
+        A1_low, A1_high = poisson_ci(A1_df['Number of persons'])
+        A1_df = A1_df.assign(low=A1_low, high=A1_high)
+    else:
+        A1_ci = monthly_injury_ci(ds, measure='NO_PERSONS_KILLED', start=DATE_RANGE[0], end=DATE_RANGE[1])[['ACCIDENTDATE','low','high']]
+        A1_df = pd.merge(A1_df, A1_ci, how="left", on="ACCIDENTDATE")
+        A1_df[['low','high']] = A1_df[['low','high']].fillna(0)
+    return A1_df
+
+def A1_plot(A1_df, figname):
+    fig = plt.figure(figsize=(10,6))
+    ax = plt.gca()
+    hue_order = list(A1_df['Injury level'].unique())
+    palette = sns.color_palette(n_colors=len(hue_order))
+    for level, color in zip(hue_order, palette):
+        df = A1_df.loc[A1_df['Injury level']==level]
+        ax.fill_between(df['ACCIDENTDATE'], df['low'], df['high'], color=color, alpha=0.2, linewidth=0)
+    sns.lineplot(
+        x='ACCIDENTDATE',
+        y='Number of persons',
+        hue='Injury level',
+        style='Injury level',
+        hue_order=hue_order,
+        palette=palette,
+        data=A1_df,
+        estimator=None,
+        ci=None,
+        ax=ax,
+        markers=True,
+        dashes=False,
+        legend=True,
+    )
+    ax.set_xlabel('Date')
+    ax.set_title(figname, fontsize=18, y=1.1)
+    ax.tick_params(axis='x',labelrotation=45)
+    ax.legend(ncol=4,bbox_to_anchor=(0.5,1.05), loc='center', borderaxespad=0.,frameon=False)
+    plt.tight_layout()
+    return fig
+
+figure_job("A1", "Injury over time", A1_data, A1_plot)
+if __name__ == "__main__": run_job("A1", ds, FIGDIR, save=SAVE, show=True)
 # %%-
 
 # %%--  2-Mortality and injury rate category statistics
-#   Fatal and serious injury datasets [Severity 1 or 2]
-A2_df = dfs_dic["ACCIDENT"].loc[dfs_dic["ACCIDENT"]["SEVERITY"]<3].copy(deep=True)
-
-#   Merge to atmospheric condition dataset keep only first sequend of events to asses initial impact data
-A2_df_atms = dfs_dic['ATMOSPHERIC_COND'].loc[dfs_dic['ATMOSPHERIC_COND']['ATMOSPH_COND_SEQ'] == 1].copy(deep=True)
-A2_df = pd.merge(A2_df, A2_df_atms,how="left", on="ACCIDENT_NO")
-
-#   Convert to injury rate percentage
-A2_df['NO_PERSONS_KILLED'] = A2_df['NO_PERSONS_KILLED']/A2_df['NO_PERSONS_KILLED'].sum()*100
-A2_df['NO_PERSONS_INJ_2'] = A2_df['NO_PERSONS_INJ_2']/A2_df['NO_PERSONS_INJ_2'].sum()*100
-
-#   Reshape data for plot
-A2_df_speed = A2_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','SPEED_ZONE']].groupby("SPEED_ZONE").sum()
-A2_df_speed.reset_index(inplace=True)
-A2_df_speed = A2_df_speed.melt(id_vars="SPEED_ZONE",var_name='Injury level',value_name='Number of persons [%]')
-A2_df_speed.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
-
-A2_df_day = A2_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','Day Week Description']].groupby("Day Week Description").sum()
-A2_df_day.reset_index(inplace=True)
-A2_df_day = A2_df_day.melt(id_vars="Day Week Description",var_name='Injury level',value_name='Number of persons [%]')
-A2_df_day.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
-
-A2_df_type = A2_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','Accident Type Desc']].groupby("Accident Type Desc").sum()
-A2_df_type.reset_index(inplace=True)
-A2_df_type = A2_df_type.melt(id_vars="Accident Type Desc",var_name='Injury level',value_name='Number of persons [%]')
-A2_df_type.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
-
-A2_df_light = A2_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','Light Condition Desc']].groupby("Light Condition Desc").sum()
-A2_df_light.reset_index(inplace=True)
-A2_df_light = A2_df_light.melt(id_vars="Light Condition Desc",var_name='Injury level',value_name='Number of persons [%]')
-A2_df_light.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
-
-A2_df_road = A2_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','Road Geometry Desc']].groupby("Road Geometry Desc").sum()
-A2_df_road.reset_index(inplace=True)
-A2_df_road = A2_df_road.melt(id_vars="Road Geometry Desc",var_name='Injury level',value_name='Number of persons [%]')
-A2_df_road.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
-
-A2_df_atm = A2_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','Atmosph Cond Desc']].groupby("Atmosph Cond Desc").sum()
-A2_df_atm.reset_index(inplace=True)
-A2_df_atm = A2_df_atm.melt(id_vars="Atmosph Cond Desc",var_name='Injury level',value_name='Number of persons [%]')
-A2_df_atm.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
-A2_df_atm = A2_df_atm.loc[A2_df_atm["Atmosph Cond Desc"]!="Not Applicable"]
-
-#   Plot
-figname = "Injury rate by category"
-fig, axes = plt.subplots(nrows=2, ncols=3, figsize=(20,15))
-x_tab = ['SPEED_ZONE', 'Day Week Description', 'Accident Type Desc', 'Light Condition Desc', 'Road Geometry Desc', 'Atmosph Cond Desc']
-df_tab = [A2_df_speed, A2_df_day, A2_df_type, A2_df_light, A2_df_road, A2_df_atm]
-xlabel_tab = ['Speed zone', 'Day of the week', 'Accident type', 'Light condition', 'Road type', 'Atmospheric condition']
-rot_tab = [0, 0, 90, 90, 90, 90]
-asc_tab = [False, False, True, True, True, True]
-for x, df, xlabel, rot, ax, asc in zip(x_tab, df_tab, xlabel_tab, rot_tab, axes.flatten(),asc_tab):
-    if asc: df.sort_values('Number of persons [%]', inplace=True, ascending=False)
-    if x == 'Day Week Description':
-        sns.barplot(
-            x=x,
-            y='Number of persons [%]',
-            hue='Injury level',
-            order=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'],
-            data=df,
-            ax=ax,
-            saturation=0.8,
-        )
+def A2_data(ds):
+    A2_dims = ['SPEED_ZONE', 'Day Week Description', 'Accident Type Desc', 'Light Condition Desc', 'Road Geometry Desc', 'Atmosph Cond Desc']
+    A2_measures = ['NO_PERSONS_KILLED','NO_PERSONS_INJ_2']
+    if INCREMENTAL and DATE_RANGE == (None, None):
+        #   Persisted category sums, updated from the accidents that changed
+        A2_cube = incremental_store(ds)
     else:
+        #   Fatal and serious injury accidents [Severity 1 or 2] with their first atmospheric condition, from the accident features
+        A2_df = read_features(ds, columns=A2_measures+A2_dims, filters=[("SEVERITY","<",3)]+date_filters(*DATE_RANGE))
+
+        #   Aggregate killed and serious injury totals over every category in a single pass
+        A2_cube = CategoryCube(A2_df, dimensions=A2_dims, measures=A2_measures)
+
+    #   Reshape data for plot with the 95% interval of the category totals, converted to injury rate percentage
+    #   Measures without any person in the range have no rate instead of dividing by zero
+    A2_totals = A2_cube.totals().replace(0, np.nan)
+    A2_dfs = {}
+    for x in A2_dims:
+        df = A2_cube.marginal(x).melt(id_vars=x,var_name='Injury level',value_name='Number of persons [%]')
+        if INCREMENTAL and DATE_RANGE == (None, None):
+            #   Persisted sums have no accident rows, use the exact Poisson interval of the totals
+            df['low'], df['high'] = poisson_ci(df['Number of persons [%]'])
+        else:
+            df = add_total_ci(df, x, A2_df, A2_measures)
+        df[['Number of persons [%]','low','high']] = df[['Number of persons [%]','low','high']].div(df['Injury level'].map(A2_totals), axis=0)*100
+        df.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
+        A2_dfs[x] = df
+    A2_dfs['Atmosph Cond Desc'] = A2_dfs['Atmosph Cond Desc'].loc[A2_dfs['Atmosph Cond Desc']["Atmosph Cond Desc"]!="Not Applicable"]
+    return A2_dfs
+
+def A2_plot(A2_dfs, figname):
+    fig, axes = plt.subplots(nrows=2, ncols=3, figsize=(20,15))
+    x_tab = ['SPEED_ZONE', 'Day Week Description', 'Accident Type Desc', 'Light Condition Desc', 'Road Geometry Desc', 'Atmosph Cond Desc']
+    df_tab = [A2_dfs[x].copy() for x in x_tab]
+    xlabel_tab = ['Speed zone', 'Day of the week', 'Accident type', 'Light condition', 'Road type', 'Atmospheric condition']
+    rot_tab = [0, 0, 90, 90, 90, 90]
+    asc_tab = [False, False, True, True, True, True]
+    for x, df, xlabel, rot, ax, asc in zip(x_tab, df_tab, xlabel_tab, rot_tab, axes.flatten(),asc_tab):
+        if df.empty:
+            draw_empty(ax, xlabel)
+            continue
+        if asc: df.sort_values('Number of persons [%]', inplace=True, ascending=False)
+        if x == 'Day Week Description':
+            sns.barplot(
+                x=x,
+                y='Number of persons [%]',
+                hue='Injury level',
+                order=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'],
+                data=df,
+                ax=ax,
+                ci=None,
+                saturation=0.8,
+            )
+        else:
+            sns.barplot(
+                x=x,
+                y='Number of persons [%]',
+                hue='Injury level',
+                data=df,
+                ax=ax,
+                ci=None,
+                saturation=0.8,
+            )
+        draw_intervals(ax, df, x)
+        ax.set_xlabel(xlabel)
+        ax.tick_params(axis='x',labelrotation=rot)
+        ax.legend_.remove()
+
+    axes[0][1].set_title(figname, fontsize=18, y=1.1)
+    axes[0][1].legend(ncol=2,bbox_to_anchor=(0.5,1.05), loc='center', borderaxespad=0.,frameon=False)
+    plt.tight_layout()
+    return fig
+
+figure_job("A2", "Injury rate by category", A2_data, A2_plot)
+if __name__ == "__main__": run_job("A2", ds, FIGDIR, save=SAVE, show=True)
+# %%-
+
+# %%--  3-Mortality and injury ratefrom vehicle type
+def A3_data(ds):
+    #   Fatal and serious injury accidents [Severity 1 or 2] with the attributes of vehicle A, assumed responsible for the accident
+    A3_dims = ['INITIAL_IMPACT','VEHICLE_MAKE','Vehicle Type Desc']
+    A3_df = read_features(ds, columns=['NO_PERSONS_KILLED','NO_PERSONS_INJ_2']+A3_dims, filters=[("SEVERITY","<",3)]+date_filters(*DATE_RANGE))
+
+    #   Convert to injury rate percentage
+    A3_df['NO_PERSONS_KILLED'] = A3_df['NO_PERSONS_KILLED']/A3_df['NO_PERSONS_KILLED'].sum()*100
+    A3_df['NO_PERSONS_INJ_2'] = A3_df['NO_PERSONS_INJ_2']/A3_df['NO_PERSONS_INJ_2'].sum()*100
+
+    #   Aggregate over the vehicle attributes in a single pass, accidents without vehicle A are left out
+    A3_cube = CategoryCube(A3_df, dimensions=A3_dims, measures=['NO_PERSONS_KILLED','NO_PERSONS_INJ_2'])
+
+    #   Impact collision statistics
+    A3_df_coll = A3_cube.marginal('INITIAL_IMPACT')
+    vocab_coll = {
+        '0': 'Towed unit',
+        '1': 'Right front corner',
+        '2': 'Right side forwards',
+        '3': 'Right side rearwards',
+        '4': 'Right rear corner',
+        '5': 'Left front corner',
+        '6': 'Left side forwards',
+        '7': 'Left side rearwards',
+        '8': 'Left rear corner',
+        '9': 'Not known/not applicable',
+        'F': 'Front',
+        'N': 'None',
+        'R': 'Rear',
+        'S': 'Sidecar',
+        'T': 'Top/roof',
+        'U': 'Undercarriag',
+    }
+    A3_df_coll.replace({'INITIAL_IMPACT': vocab_coll}, inplace=True)
+
+    #   Reshape data for plot and keep top n categories based on total person killed and inured
+    n=10
+    A3_df_maker = A3_cube.marginal('VEHICLE_MAKE')
+    A3_df_maker['Total'] = A3_df_maker['NO_PERSONS_KILLED']+A3_df_maker['NO_PERSONS_INJ_2']
+    A3_df_maker = A3_df_maker.nlargest(n,'Total')
+    A3_df_maker = A3_df_maker.melt(id_vars="VEHICLE_MAKE", value_vars=['NO_PERSONS_KILLED','NO_PERSONS_INJ_2'], var_name='Injury level', value_name='Number of persons [%]')
+    A3_df_maker = add_total_ci(A3_df_maker, "VEHICLE_MAKE", A3_df, ['NO_PERSONS_KILLED','NO_PERSONS_INJ_2'])
+    A3_df_maker.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
+
+    A3_df_type = A3_cube.marginal('Vehicle Type Desc')
+    A3_df_type['Total'] = A3_df_type['NO_PERSONS_KILLED']+A3_df_type['NO_PERSONS_INJ_2']
+    A3_df_type = A3_df_type.nlargest(n,'Total')
+    A3_df_type = A3_df_type.melt(id_vars="Vehicle Type Desc", value_vars=['NO_PERSONS_KILLED','NO_PERSONS_INJ_2'], var_name='Injury level',value_name='Number of persons [%]')
+    A3_df_type = add_total_ci(A3_df_type, "Vehicle Type Desc", A3_df, ['NO_PERSONS_KILLED','NO_PERSONS_INJ_2'])
+    A3_df_type.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
+    return {"coll": A3_df_coll, "type": A3_df_type, "maker": A3_df_maker}
+
+def A3_report(A3_dfs):
+    #   Print impact collision statistics
+    A3_df_coll = A3_dfs["coll"]
+    killed = "Killed: "+A3_df_coll['NO_PERSONS_KILLED'].map("{:.2F} %; \t ".format).astype(str)
+    inj = "Serious injury : "+A3_df_coll['NO_PERSONS_INJ_2'].map("{:.2F} %; \t ".format).astype(str)
+    impact = "Impact point:  "+A3_df_coll["INITIAL_IMPACT"].astype(str)
+    for line in killed+inj+impact: print(line)
+
+def A3_plot(A3_dfs, figname):
+    #   Plot
+    fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(17,5))
+    x_tab = ['Vehicle Type Desc', 'VEHICLE_MAKE']
+    df_tab = [A3_dfs["type"].copy(), A3_dfs["maker"].copy()]
+    xlabel_tab = ['Vehicle type', 'Vehicle maker']
+    rot_tab = [90, 90]
+    for x, df, xlabel, rot, ax in zip(x_tab, df_tab, xlabel_tab, rot_tab, axes.flatten()):
+        if df[x].dtype.name == 'category': df[x] = df[x].astype(object)
+        if df.empty:
+            draw_empty(ax, xlabel)
+            continue
+        df.sort_values('Number of persons [%]', inplace=True, ascending=False)
         sns.barplot(
             x=x,
             y='Number of persons [%]',
             hue='Injury level',
             data=df,
             ax=ax,
+            ci=None,
             saturation=0.8,
         )
-    ax.set_xlabel(xlabel)
-    ax.tick_params(axis='x',labelrotation=rot)
-    ax.legend_.remove()
-
-axes[0][1].set_title(figname, fontsize=18, y=1.1)
-axes[0][1].legend(ncol=2,bbox_to_anchor=(0.5,1.05), loc='center', borderaxespad=0.,frameon=False)
-plt.tight_layout()
-if SAVE: plt.savefig(FIGDIR+"\\"+datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png",transparent=True,bbox_inches='tight')
-plt.show()
+        draw_intervals(ax, df, x)
+        ax.set_xlabel(xlabel)
+        ax.tick_params(axis='x',labelrotation=rot)
+        ax.legend_.remove()
+
+    axes[0].set_title(figname, fontsize=18, y=1.05)
+    axes[0].legend(ncol=2,bbox_to_anchor=(1.5,1.07), loc='center', borderaxespad=0.,frameon=False)
+    plt.tight_layout()
+    return fig
+
+figure_job("A3", "Injury rate by vehicle type and maker", A3_data, A3_plot, A3_report)
+if __name__ == "__main__": run_job("A3", ds, FIGDIR, save=SAVE, show=True)
 # %%-
 
-# %%--  3-Mortality and injury ratefrom vehicle type
-#   Fatal and serious injury datasets [Severity 1 or 2]
-A3_df = dfs_dic["ACCIDENT"].loc[dfs_dic["ACCIDENT"]["SEVERITY"]<3].copy(deep=True)
-
-#   Convert to injury rate percentage
-A3_df['NO_PERSONS_KILLED'] = A3_df['NO_PERSONS_KILLED']/A3_df['NO_PERSONS_KILLED'].sum()*100
-A3_df['NO_PERSONS_INJ_2'] = A3_df['NO_PERSONS_INJ_2']/A3_df['NO_PERSONS_INJ_2'].sum()*100
-
-#   Merge to vehcile dataset assuming vehicle 1 is the vehcile responsible for the accident
-A3_df_vehic = dfs_dic['VEHICLE'].loc[dfs_dic['VEHICLE']['VEHICLE_ID'] == "A"].copy(deep=True)
-A3_df = pd.merge(A3_df, A3_df_vehic,how="left", on="ACCIDENT_NO")
-
-#   Print impact collision statistics
-A3_df_coll = A3_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','INITIAL_IMPACT']].groupby("INITIAL_IMPACT").sum()
-A3_df_coll.reset_index(inplace=True)
-vocab_coll = {
-    '0': 'Towed unit',
-    '1': 'Right front corner',
-    '2': 'Right side forwards',
-    '3': 'Right side rearwards',
-    '4': 'Right rear corner',
-    '5': 'Left front corner',
-    '6': 'Left side forwards',
-    '7': 'Left side rearwards',
-    '8': 'Left rear corner',
-    '9': 'Not known/not applicable',
-    'F': 'Front',
-    'N': 'None',
-    'R': 'Rear',
-    'S': 'Sidecar',
-    'T': 'Top/roof',
-    'U': 'Undercarriag',
-}
-A3_df_coll.replace({'INITIAL_IMPACT': vocab_coll}, inplace=True)
-for i, row in A3_df_coll.iterrows():
-    print("Killed: %.2F %%; \t"%(row['NO_PERSONS_KILLED']),"Serious injury : %.2F %%; \t"%(row['NO_PERSONS_INJ_2']),"Impact point: ",row["INITIAL_IMPACT"])
-
-#   Reshape data for plot and keep top n categories based on total person killed and inured
-n=10
-A3_df_maker = A3_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','VEHICLE_MAKE']].groupby("VEHICLE_MAKE").sum()
-A3_df_maker.reset_index(inplace=True)
-A3_df_maker['Total'] = A3_df_maker['NO_PERSONS_KILLED']+A3_df_maker['NO_PERSONS_INJ_2']
-A3_df_maker = A3_df_maker.nlargest(n,'Total')
-A3_df_maker = A3_df_maker.melt(id_vars="VEHICLE_MAKE", value_vars=['NO_PERSONS_KILLED','NO_PERSONS_INJ_2'], var_name='Injury level', value_name='Number of persons [%]')
-A3_df_maker.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
-
-A3_df_type = A3_df[['NO_PERSONS_KILLED','NO_PERSONS_INJ_2','Vehicle Type Desc']].groupby("Vehicle Type Desc").sum()
-A3_df_type.reset_index(inplace=True)
-A3_df_type['Total'] = A3_df_type['NO_PERSONS_KILLED']+A3_df_type['NO_PERSONS_INJ_2']
-A3_df_type = A3_df_type.nlargest(n,'Total')
-A3_df_type = A3_df_type.melt(id_vars="Vehicle Type Desc", value_vars=['NO_PERSONS_KILLED','NO_PERSONS_INJ_2'], var_name='Injury level',value_name='Number of persons [%]')
-A3_df_type.replace({'Injury level':{'NO_PERSONS_KILLED':'Killed','NO_PERSONS_INJ_2':'Serious injury'}}, inplace=True)
-
-#   Plot
-figname = "Injury rate by vehicle type and maker"
-fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(17,5))
-x_tab = ['Vehicle Type Desc', 'VEHICLE_MAKE']
-df_tab = [A3_df_type, A3_df_maker]
-xlabel_tab = ['Vehicle type', 'Vehicle maker']
-rot_tab = [90, 90]
-for x, df, xlabel, rot, ax in zip(x_tab, df_tab, xlabel_tab, rot_tab, axes.flatten()):
-    df.sort_values('Number of persons [%]', inplace=True, ascending=False)
-    sns.barplot(
-        x=x,
-        y='Number of persons [%]',
-        hue='Injury level',
-        data=df,
-        ax=ax,
-        saturation=0.8,
+# %%--  4-Mortality and injury rate by car manufacturing year and accident oldness
+def A4_data(ds):
+    #   Fatal and serious injury datasets [Severity 1 or 2]
+    #   Accidents whose vehicle A, assumed responsible for the accident, is a car [VEHICLE_TYPE 1], with the car age at the accident
+    A4_df = read_features(
+        ds,
+        columns=['VEHICLE_YEAR_MANUF','VEHICLE_AGE','NO_PERSONS_KILLED','NO_PERSONS_INJ_2','SEVERITY'],
+        filters=[("SEVERITY","<",3),("VEHICLE_TYPE","==",1)]+date_filters(*DATE_RANGE),
     )
-    ax.set_xlabel(xlabel)
-    ax.tick_params(axis='x',labelrotation=rot)
-    ax.legend_.remove()
-
-axes[0].set_title(figname, fontsize=18, y=1.05)
-axes[0].legend(ncol=2,bbox_to_anchor=(1.5,1.07), loc='center', borderaxespad=0.,frameon=False)
-plt.tight_layout()
-if SAVE: plt.savefig(FIGDIR+"\\"+datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png",transparent=True,bbox_inches='tight')
-plt.show()
-# %%-
 
-# %%--  4-Mortality and injury rate by car manufacturing year and accident oldness
-#   Fatal and serious injury datasets [Severity 1 or 2]
-A4_df = dfs_dic["ACCIDENT"].loc[dfs_dic["ACCIDENT"]["SEVERITY"]<3].copy(deep=True)
-
-#   Merge to vehcile dataset assuming vehicle 1 is the vehcile responsible for the accident
-A4_df_vehic = dfs_dic['VEHICLE'].loc[dfs_dic['VEHICLE']['VEHICLE_ID'] == "A"].copy(deep=True)
-A4_df = pd.merge(A4_df, A4_df_vehic,how="left", on="ACCIDENT_NO")
-
-#   Only keep cars [VEHICLE_TYPE 1]
-A4_df = A4_df.loc[A4_df['VEHICLE_TYPE']==1]
-
-#   Keep rows with Valid Manufacturing year and relevant columns
-A4_df = A4_df.dropna(subset=['VEHICLE_YEAR_MANUF'])
-A4_df = A4_df.loc[A4_df['VEHICLE_YEAR_MANUF']!=0]
-A4_df = A4_df[['VEHICLE_YEAR_MANUF','ACCIDENTDATE','NO_PERSONS_KILLED','NO_PERSONS_INJ_2','SEVERITY']]
-
-#   Convert to injury rate percentage
-A4_df['NO_PERSONS_KILLED'] = A4_df['NO_PERSONS_KILLED']/A4_df['NO_PERSONS_KILLED'].sum()*100
-A4_df['NO_PERSONS_INJ_2'] = A4_df['NO_PERSONS_INJ_2']/A4_df['NO_PERSONS_INJ_2'].sum()*100
-
-#   Calculate car age at accident [Age at accident]
-A4_df['ACCIDENTDATE'] = pd.to_datetime(A4_df['ACCIDENTDATE'],infer_datetime_format=True)
-A4_df['AGE'] = [date.year-manuf for date,manuf in zip(A4_df['ACCIDENTDATE'],A4_df['VEHICLE_YEAR_MANUF'])]
-
-#   Reshape data for plot
-A4_df_killed = A4_df.loc[A4_df['SEVERITY']==1]
-A4_df_killed = A4_df_killed[['NO_PERSONS_KILLED','VEHICLE_YEAR_MANUF','AGE']].groupby(['VEHICLE_YEAR_MANUF','AGE']).sum()
-A4_df_killed.reset_index(inplace=True)
-
-A4_df_inj = A4_df.loc[A4_df['SEVERITY']==2]
-A4_df_inj = A4_df_inj[['NO_PERSONS_INJ_2','VEHICLE_YEAR_MANUF','AGE']].groupby(['VEHICLE_YEAR_MANUF','AGE']).sum()
-A4_df_inj.reset_index(inplace=True)
-#   Plot
-figname = "Vehicle manufacturing date and age injury rate"
-alpha = 1
-size = 100
-vmin = 0
-vmax = 0.5
-fig = plt.figure(figsize=(10,10))
-gs = gridspec.GridSpec(nrows=2, ncols=2, figure=fig)
-ax1 = fig.add_subplot(gs[0,0])
-ax2 = fig.add_subplot(gs[0,1])
-ax3 = fig.add_subplot(gs[1,:])
-
-ax1.scatter(A4_df_inj['VEHICLE_YEAR_MANUF'],A4_df_inj['AGE'],marker=".",s=size, c=A4_df_inj['NO_PERSONS_INJ_2'], alpha=alpha, label="Injured", vmin=vmin, vmax=vmax)
-sc = ax2.scatter(A4_df_killed['VEHICLE_YEAR_MANUF'],A4_df_killed['AGE'],marker=".",s=size, c=A4_df_killed['NO_PERSONS_KILLED'], alpha=alpha, label="Killed", vmin=vmin, vmax=vmax)
-sns.kdeplot(
-    data=A4_df,
-    ax=ax3,
-    x='VEHICLE_YEAR_MANUF',
-    fill=True,
-    legend=False,
-    color="firebrick",
-    clip=(1900,2021),
-)
-
-ax1.set_title(figname, fontsize=18, y=1.05, x=1.2)
-ax1.set_xlim(1970,2020)
-ax1.set_ylim(0,50)
-ax1.set_xlabel('Manufacturing year')
-ax1.set_ylabel('Age at accident')
-
-ax2.set_xlim(1970,2020)
-ax2.set_ylim(0,50)
-ax2.set_xlabel('Manufacturing year')
-
-ax3.set_xlim(1970,2020)
-ax3.set_xlabel('Manufacturing year')
-ax3.set_title("Vehicle manufacturing distribution", fontsize=14, y=0.9, x=0.25)
-
-cbar=fig.colorbar(sc, ax=ax3)
-cbar.set_label("Injury rate")
-
-if SAVE: plt.savefig(FIGDIR+"\\"+datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png",transparent=True,bbox_inches='tight')
-plt.show()
+    #   Keep rows with Valid Manufacturing year
+    A4_df = A4_df.loc[valid_year_manuf(A4_df['VEHICLE_YEAR_MANUF'])].rename(columns={'VEHICLE_AGE': 'AGE'})
+
+    #   Convert to injury rate percentage
+    A4_df['NO_PERSONS_KILLED'] = A4_df['NO_PERSONS_KILLED']/A4_df['NO_PERSONS_KILLED'].sum()*100
+    A4_df['NO_PERSONS_INJ_2'] = A4_df['NO_PERSONS_INJ_2']/A4_df['NO_PERSONS_INJ_2'].sum()*100
+
+    #   Reshape data for plot
+    A4_df_killed = A4_df.loc[A4_df['SEVERITY']==1]
+    A4_df_killed = A4_df_killed[['NO_PERSONS_KILLED','VEHICLE_YEAR_MANUF','AGE']].groupby(['VEHICLE_YEAR_MANUF','AGE']).sum()
+    A4_df_killed.reset_index(inplace=True)
+
+    A4_df_inj = A4_df.loc[A4_df['SEVERITY']==2]
+    A4_df_inj = A4_df_inj[['NO_PERSONS_INJ_2','VEHICLE_YEAR_MANUF','AGE']].groupby(['VEHICLE_YEAR_MANUF','AGE']).sum()
+    A4_df_inj.reset_index(inplace=True)
+    return {"all": A4_df[['VEHICLE_YEAR_MANUF']], "killed": A4_df_killed, "inj": A4_df_inj}
+
+def A4_plot(A4_dfs, figname):
+    A4_df, A4_df_killed, A4_df_inj = A4_dfs["all"], A4_dfs["killed"], A4_dfs["inj"]
+    alpha = 1
+    size = 100
+    vmin = 0
+    vmax = 0.5
+    fig = plt.figure(figsize=(10,10))
+    gs = gridspec.GridSpec(nrows=2, ncols=2, figure=fig)
+    ax1 = fig.add_subplot(gs[0,0])
+    ax2 = fig.add_subplot(gs[0,1])
+    ax3 = fig.add_subplot(gs[1,:])
+
+    ax1.scatter(A4_df_inj['VEHICLE_YEAR_MANUF'],A4_df_inj['AGE'],marker=".",s=size, c=A4_df_inj['NO_PERSONS_INJ_2'], alpha=alpha, label="Injured", vmin=vmin, vmax=vmax)
+    sc = ax2.scatter(A4_df_killed['VEHICLE_YEAR_MANUF'],A4_df_killed['AGE'],marker=".",s=size, c=A4_df_killed['NO_PERSONS_KILLED'], alpha=alpha, label="Killed", vmin=vmin, vmax=vmax)
+    sns.kdeplot(
+        data=A4_df,
+        ax=ax3,
+        x='VEHICLE_YEAR_MANUF',
+        fill=True,
+        legend=False,
+        color="firebrick",
+        clip=(1900,2021),
+    )
+
+    ax1.set_title(figname, fontsize=18, y=1.05, x=1.2)
+    ax1.set_xlim(1970,2020)
+    ax1.set_ylim(0,50)
+    ax1.set_xlabel('Manufacturing year')
+    ax1.set_ylabel('Age at accident')
+
+    ax2.set_xlim(1970,2020)
+    ax2.set_ylim(0,50)
+    ax2.set_xlabel('Manufacturing year')
+
+    ax3.set_xlim(1970,2020)
+    ax3.set_xlabel('Manufacturing year')
+    ax3.set_title("Vehicle manufacturing distribution", fontsize=14, y=0.9, x=0.25)
+
+    cbar=fig.colorbar(sc, ax=ax3)
+    cbar.set_label("Injury rate")
+    return fig
+
+figure_job("A4", "Vehicle manufacturing date and age injury rate", A4_data, A4_plot)
+if __name__ == "__main__": run_job("A4", ds, FIGDIR, save=SAVE, show=True)
 # %%-
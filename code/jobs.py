@@ -0,0 +1,185 @@
+"Registry of the figure jobs and helpers to run and save them"
+import datetime
+import fnmatch
+import hashlib
+import inspect
+import json
+from collections import namedtuple
+from importlib import metadata
+from pathlib import Path
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from dataloader import write_atomic
+from profiling import stage, count_rows
+
+# %%--  Settings
+RENDER_CACHE = True                 # Skip the figures whose data, style and plot code did not change since their last save
+RENDER_FOLDER = ".render_cache"     # Folder of figdir holding the render key of the last saved version of each figure
+RENDER_LIBRARIES = ("matplotlib", "seaborn", "numpy", "pandas")   # Versions part of the render key
+CODE_DIR = Path(__file__).parent    # Functions defined here are followed by the render key, library ones are covered by their version
+# %%-
+
+# %%--  Registry
+FigureJob = namedtuple("FigureJob", ["name", "figname", "data", "plot", "report"])
+JOBS = {}
+
+def figure_job(name, figname, data, plot=None, report=None):
+    """Register a section as a figure job.
+
+    data(ds) computes everything the section needs from a CrashDataset,
+    report(data) prints its statistics and plot(data, figname) draws it and
+    returns the figure. The report always runs, even when the figure is
+    unchanged and not drawn again. Sections that only print statistics have
+    no plot.
+    """
+    JOBS[name] = FigureJob(name, figname, data, plot, report)
+    return JOBS[name]
+
+def select_jobs(patterns=None):
+    "Names of the registered jobs matching any of the patterns [e.g. A2, B*], all jobs if None"
+    if not patterns: return list(JOBS)
+    names = [name for name in JOBS if any(fnmatch.fnmatchcase(name, p) for p in patterns)]
+    unknown = [p for p in patterns if not fnmatch.filter(JOBS, p)]
+    if unknown: raise KeyError("Unknown figure jobs: %s [available: %s]"%(", ".join(unknown), ", ".join(JOBS)))
+    return names
+# %%-
+
+# %%--  Render cache
+def update_data_hash(h, data):
+    "Feed the content of a job data [frames, arrays, containers of them or plain values] to a hash"
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        labels = data.columns if isinstance(data, pd.DataFrame) else data.name
+        h.update(repr((type(data).__name__, labels, data.dtypes, data.index.names)).encode())
+        h.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    elif isinstance(data, np.ndarray):
+        h.update(repr((data.dtype, data.shape)).encode())
+        h.update(np.ascontiguousarray(data).tobytes())
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            h.update(repr(key).encode())
+            update_data_hash(h, value)
+    elif isinstance(data, (list, tuple)):
+        h.update(repr((type(data).__name__, len(data))).encode())
+        for value in data: update_data_hash(h, value)
+    else:
+        h.update(repr(data).encode())
+
+def is_repo_code(value):
+    "True for the functions and classes of the code folder, whose source is part of the render key"
+    if not (inspect.isfunction(value) or inspect.isclass(value)): return False
+    try:
+        return Path(inspect.getsourcefile(value)).parent == CODE_DIR
+    except TypeError:
+        return False
+
+def code_names(code):
+    "Global names used by a code object and the lambdas, comprehensions and functions nested in it"
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const): names |= code_names(const)
+    return names
+
+def plot_signature(plot):
+    """Source of a plot function with the settings and helpers it reaches.
+
+    Functions of the code folder are followed transitively [e.g. draw_density
+    then rasterize and the SCALINGS functions] with their default arguments,
+    module level values [e.g. RESOLUTION] are included by value. Changing any of
+    them renders the figure again.
+    """
+    signature = {}
+    def describe(value):
+        if isinstance(value, (str, int, float, bool, type(None))): return repr(value)
+        if isinstance(value, (list, tuple)): return [describe(item) for item in value]
+        if isinstance(value, dict): return {repr(key): describe(item) for key, item in value.items()}
+        if is_repo_code(value):
+            name = value.__module__+"."+value.__qualname__
+            if name not in signature: follow(name, value)
+            return name
+        return None
+    def follow(name, func):
+        signature[name] = {"source": inspect.getsource(func)}
+        if inspect.isclass(func): return
+        signature[name]["defaults"] = describe(func.__defaults__)
+        signature[name]["kwdefaults"] = describe(func.__kwdefaults__)
+        signature[name]["names"] = {
+            used: describe(func.__globals__[used])
+            for used in sorted(code_names(func.__code__)) if used in func.__globals__
+        }
+    follow(plot.__module__+"."+plot.__qualname__, plot)
+    return signature
+
+def render_key(job, data):
+    "Hash of everything a figure depends on: job data, matplotlib style, plot code and library versions"
+    h = hashlib.sha1()
+    update_data_hash(h, data)
+    style = {key: repr(value) for key, value in matplotlib.rcParams.items() if not key.startswith("backend")}
+    h.update(json.dumps({
+        "figname": job.figname,
+        "style": style,
+        "libraries": {library: metadata.version(library) for library in RENDER_LIBRARIES},
+        "plot": plot_signature(job.plot),
+    }, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+def render_path(figdir, figname):
+    return Path(figdir)/RENDER_FOLDER/(figname+".json")
+
+def cached_render(job, figdir, key):
+    "Path of the last saved figure of the job if its render key is unchanged and the png still exists, else None"
+    try:
+        entry = json.loads(render_path(figdir, job.figname).read_text())
+    except (OSError, ValueError):
+        return None
+    path = Path(figdir)/entry.get("figure", "")
+    if entry.get("key") != key or not path.is_file(): return None
+    return path
+
+def store_render(job, figdir, key, path):
+    "Record the render key of a saved figure"
+    render_path(figdir, job.figname).parent.mkdir(parents=True, exist_ok=True)
+    entry = json.dumps({"key": key, "figure": Path(path).name})
+    write_atomic(render_path(figdir, job.figname), lambda tmp_path: Path(tmp_path).write_text(entry))
+# %%-
+
+# %%--  Running
+def save_figure(fig, figname, figdir):
+    "Save a figure as a timestamped transparent png and return its path"
+    path = Path(figdir)/(datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png")
+    fig.savefig(path, transparent=True, bbox_inches='tight')
+    return path
+
+def run_job(name, ds, figdir=None, save=True, show=False, cache=RENDER_CACHE):
+    """Compute, draw and save one job, each step recorded as a profiling stage. Returns the saved figure path, or None
+
+    With cache, a saved figure is not drawn again while its render key is
+    unchanged, and the path of the previous png is returned instead.
+    """
+    job = JOBS[name]
+    cache = cache and save and not show
+    with stage(name):
+        with stage("data") as record:
+            data = job.data(ds)
+            record["rows"] = count_rows(data)
+        if job.report is not None:
+            with stage("report"): job.report(data)
+        if job.plot is None: return None
+        if cache:
+            with stage("render_key"):
+                key = render_key(job, data)
+                path = cached_render(job, figdir, key)
+            if path is not None: return path
+        with stage("plot"):
+            fig = job.plot(data, job.figname)
+        if fig is None: return None
+        with stage("save"):
+            path = save_figure(fig, job.figname, figdir) if save else None
+            if cache: store_render(job, figdir, key, path)
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+    return path
+# %%-
@@ -0,0 +1,162 @@
+"Integer ACCIDENT_NO dictionary and sorted row offsets of every table, persisted next to the cache"
+import json
+import numpy as np
+from pathlib import Path
+from dataloader import CACHE_FOLDER, source_signature, write_atomic
+from profiling import profiled
+
+# %%--  Settings
+KEY = "ACCIDENT_NO"
+KEY_FOLDER = "keys"
+_INDEXES = {}
+# %%-
+
+# %%--  Key index
+class TableKeys:
+    """Accident ids of the rows of one table in CSR form.
+
+    ids[row] is the accident id of each row of the cached table, and the rows
+    of accident i are order[offsets[i]:offsets[i+1]], in table order.
+    """
+    def __init__(self, ids, order, offsets):
+        self.ids = ids
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def from_ids(cls, ids, nkeys):
+        order = np.argsort(ids, kind="stable").astype(np.int32)
+        offsets = np.zeros(nkeys+1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=nkeys), out=offsets[1:])
+        return cls(ids, order, offsets)
+
+    def counts(self):
+        "Number of rows of each accident"
+        return np.diff(self.offsets)
+
+    def first_rows(self, where=None):
+        """Position of the first row of each accident, -1 when it has none.
+
+        where is an optional boolean mask over the table rows, e.g.
+        ATMOSPH_COND_SEQ == 1, restricting the rows that can be picked.
+        """
+        first = np.full(len(self.offsets)-1, -1, dtype=np.int64)
+        if where is None:
+            has_rows = self.counts() > 0
+            first[has_rows] = self.order[self.offsets[:-1][has_rows]]
+            return first
+        candidates = self.order[np.asarray(where, dtype=bool)[self.order]]
+        candidate_ids = self.ids[candidates]
+        starts = np.flatnonzero(np.r_[True, candidate_ids[1:] != candidate_ids[:-1]])
+        first[candidate_ids[starts]] = candidates[starts]
+        return first
+
+class KeyIndex:
+    """Dense int32 ids of ACCIDENT_NO shared by all tables.
+
+    keys is the sorted array of every accident number found in the tables, an
+    accident id being its position in keys. Encoding is a binary search on a
+    fixed width string array, so joins and first row picks never hash the
+    accident number strings again.
+    """
+    def __init__(self, keys, tables):
+        self.keys = keys
+        self.tables = tables
+
+    def __len__(self):
+        return len(self.keys)
+
+    def encode(self, accident_no):
+        "Accident ids of an array of accident numbers, -1 for unknown numbers"
+        values = np.asarray(accident_no, dtype=self.keys.dtype)
+        ids = np.searchsorted(self.keys, values).astype(np.int32)
+        ids[ids == len(self.keys)] = 0
+        ids[self.keys[ids] != values] = -1
+        return ids
+
+    def decode(self, ids):
+        "Accident numbers of an array of accident ids"
+        return self.keys[ids].astype(object)
+
+    def first_rows(self, table, ids, where=None):
+        "Position in table of the first row of each accident id [see TableKeys.first_rows], -1 when none"
+        first = self.tables[table].first_rows(where)
+        ids = np.asarray(ids)
+        return np.where(ids >= 0, first[np.maximum(ids, 0)], -1)
+
+    @profiled("join_first")
+    def join_first(self, left, table, right, where=None):
+        """Left join of left with the first row of each accident in table.
+
+        right holds columns of the full table in cache row order, e.g.
+        ds.read(table, columns=[...]) without filters. Replaces merge(left,
+        right.loc[where].drop_duplicates(KEY), how="left", on=KEY).
+        """
+        if len(right) != len(self.tables[table].ids):
+            raise ValueError("%s rows do not match the key index [%d != %d]"%(table, len(right), len(self.tables[table].ids)))
+        rows = self.first_rows(table, self.encode(left[KEY]), where)
+        found = rows >= 0
+        df = left.reset_index(drop=True)
+        for col in right.columns:
+            if col == KEY or col in df.columns: continue
+            values = right[col].take(np.maximum(rows, 0)).reset_index(drop=True)
+            df[col] = values.where(found) if not found.all() else values
+        return df
+# %%-
+
+# %%--  Persistence
+def index_paths(datadir):
+    "Folder of the key index and of its signature file"
+    folder = Path(datadir)/CACHE_FOLDER/KEY_FOLDER
+    return folder, folder/"keys.json"
+
+def table_signatures(ds):
+    "Signatures of the source csv of every table, the index is rebuilt when any of them changes"
+    return {filename: source_signature(Path(ds.datadir)/(filename+".csv")) for filename in ds.keys()}
+
+def save_arrays(path, **arrays):
+    "Atomically write named arrays to an uncompressed npz file"
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f: np.savez(f, **arrays)
+    write_atomic(path, write)
+
+@profiled("key_index")
+def build_key_index(ds):
+    "Encode the ACCIDENT_NO column of every table and store the dictionary and row offsets"
+    folder, meta_path = index_paths(ds.datadir)
+    folder.mkdir(parents=True, exist_ok=True)
+    signatures = table_signatures(ds)
+    columns = {}
+    for filename in ds.keys():
+        columns[filename] = ds.read(filename, columns=[KEY])[KEY].to_numpy(dtype=str)
+    keys = np.unique(np.concatenate(list(columns.values())))
+    save_arrays(folder/"keys.npz", keys=keys)
+    tables = {}
+    for filename, values in columns.items():
+        tables[filename] = TableKeys.from_ids(np.searchsorted(keys, values).astype(np.int32), len(keys))
+        save_arrays(folder/(filename+".npz"), ids=tables[filename].ids, order=tables[filename].order, offsets=tables[filename].offsets)
+    #   Signature is written last so an interrupted build is rebuilt on the next run
+    write_atomic(meta_path, lambda path: Path(path).write_text(json.dumps({"tables": list(tables), "signatures": signatures})))
+    return KeyIndex(keys, tables)
+
+def load_key_index(ds):
+    "Stored key index, or None when missing or built from other extracts"
+    folder, meta_path = index_paths(ds.datadir)
+    if not meta_path.exists(): return None
+    with open(meta_path) as f: meta = json.load(f)
+    if meta["signatures"] != table_signatures(ds): return None
+    keys = np.load(folder/"keys.npz")["keys"]
+    tables = {}
+    for filename in meta["tables"]:
+        with np.load(folder/(filename+".npz")) as arrays:
+            tables[filename] = TableKeys(arrays["ids"], arrays["order"], arrays["offsets"])
+    return KeyIndex(keys, tables)
+
+def key_index(ds):
+    "Key index of the dataset, loaded or rebuilt once per process"
+    datadir = str(ds.datadir)
+    if datadir not in _INDEXES:
+        index = load_key_index(ds)
+        _INDEXES[datadir] = index if index is not None else build_key_index(ds)
+    return _INDEXES[datadir]
+# %%-
@@ -3,10 +3,17 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import LogNorm
 import seaborn as sns
-import datetime
 from pathlib import Path
 from matplotlibstyle import *
+from dataloader import CrashDataset
+from derived import serious_accident_nodes
+from spatial import query_window
+from raster import draw_density
+from hotspots import black_spots, cell_sums, hex_corners
+from jobs import figure_job, run_job
 # %%-
 
 # %%--  Settings
@@ -14,24 +21,12 @@ DIR = Path(__file__).parent.parent
 DATADIR = str(DIR/'data')
 FIGDIR = str(DIR/'figures')
 SAVE = True
+RENDER = "scatter"                  # "scatter" draws every accident, "raster" draws a density image
+RASTER_WEIGHT = "TOTAL_INJURY"      # Column weighting the raster pixels, None to count accidents
 # %%-
 
 # %%--  Data loading
-filenames = [
-    "ACCIDENT_CHAINAGE",
-    "ACCIDENT_EVENT",
-    "ACCIDENT_LOCATION",
-    "ACCIDENT",
-    "ATMOSPHERIC_COND",
-    "NODE_ID_COMPLEX_INT_ID",
-    "NODE",
-    "PERSON",
-    "SUBDCA",
-    "VEHICLE"
-]
-dfs_dic = {}
-for filename in filenames:
-    dfs_dic[filename] = pd.read_csv(DATADIR+"\\"+filename+".csv")
+ds = CrashDataset(DATADIR)
 # %%-
 
 #\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
@@ -39,142 +34,191 @@ for filename in filenames:
 #///////////////////////////////////////////////////////////////////////////////
 
 # %%--  0-Map road of all Serious and fatal accident
-#   Fatal and serious injury datasets [Severity 1 or 2]
-B0_df = dfs_dic["ACCIDENT"].loc[dfs_dic["ACCIDENT"]["SEVERITY"]<3].copy(deep=True)
-
-#   Merge to NODE dataset to access location. Remove ACCIDENT_NO duplicates
-B0_df_node = dfs_dic['NODE'].copy(deep=True)
-B0_df_node.drop_duplicates(subset=['ACCIDENT_NO'], inplace=True)
-B0_df = pd.merge(B0_df, B0_df_node,how="left", on="ACCIDENT_NO")
-B0_df['TOTAL_INJURY'] = B0_df['NO_PERSONS_KILLED'] + B0_df['NO_PERSONS_INJ_2']
-
-#   Convert to injury rate percentage
-B0_df['TOTAL_INJURY'] = B0_df['TOTAL_INJURY']/B0_df['TOTAL_INJURY'].sum()*100
-B0_df['NO_PERSONS_KILLED'] = B0_df['NO_PERSONS_KILLED']/B0_df['NO_PERSONS_KILLED'].sum()*100
-B0_df['NO_PERSONS_INJ_2'] = B0_df['NO_PERSONS_INJ_2']/B0_df['NO_PERSONS_INJ_2'].sum()*100
-
-#   Reshape data for plot
-B0_df_killed = B0_df.loc[B0_df['SEVERITY']==1]
-B0_df_inj = B0_df.loc[B0_df['SEVERITY']==2]
-
-#   Plot map of all serious accidents
-figname = "Injury and fatality map"
-alpha = 0.3
-size = 1
-
-fig, (ax1,ax2) = plt.subplots(nrows=1, ncols=2, figsize=(10,5))
-ax1.scatter(B0_df_inj["VICGRID94_X"],B0_df_inj["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="orchid")
-ax2.scatter(B0_df_killed["VICGRID94_X"],B0_df_killed["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="k")
-
-ax1.set_aspect("equal")
-ax1.axis("off")
-
-ax2.set_aspect("equal")
-ax2.axis("off")
-
-if SAVE: plt.savefig(FIGDIR+"\\"+datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png",transparent=True,bbox_inches='tight')
-plt.tight_layout()
-plt.show()
+def B0_data(ds):
+    #   Fatal and serious injury accidents joined to their location [shared with B0-B3]
+    B0_df = serious_accident_nodes(ds)
+
+    #   Convert to injury rate percentage
+    B0_df = B0_df.assign(
+        NO_PERSONS_KILLED=B0_df['NO_PERSONS_KILLED']/B0_df['NO_PERSONS_KILLED'].sum()*100,
+        NO_PERSONS_INJ_2=B0_df['NO_PERSONS_INJ_2']/B0_df['NO_PERSONS_INJ_2'].sum()*100,
+    )
+
+    #   Reshape data for plot
+    B0_df_killed = B0_df.loc[B0_df['SEVERITY']==1]
+    B0_df_inj = B0_df.loc[B0_df['SEVERITY']==2]
+    return {"killed": B0_df_killed, "inj": B0_df_inj}
+
+def B0_plot(B0_dfs, figname):
+    #   Plot map of all serious accidents
+    B0_df_killed, B0_df_inj = B0_dfs["killed"], B0_dfs["inj"]
+    alpha = 0.3
+    size = 1
+
+    fig, (ax1,ax2) = plt.subplots(nrows=1, ncols=2, figsize=(10,5))
+    if RENDER == "raster":
+        draw_density(ax1, B0_df_inj["VICGRID94_X"], B0_df_inj["VICGRID94_Y"], weights=B0_df_inj[RASTER_WEIGHT] if RASTER_WEIGHT else None, color="orchid")
+        draw_density(ax2, B0_df_killed["VICGRID94_X"], B0_df_killed["VICGRID94_Y"], weights=B0_df_killed[RASTER_WEIGHT] if RASTER_WEIGHT else None, color="k")
+    else:
+        ax1.scatter(B0_df_inj["VICGRID94_X"],B0_df_inj["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="orchid")
+        ax2.scatter(B0_df_killed["VICGRID94_X"],B0_df_killed["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="k")
+
+    ax1.set_aspect("equal")
+    ax1.axis("off")
+
+    ax2.set_aspect("equal")
+    ax2.axis("off")
+    return fig
+
+figure_job("B0", "Injury and fatality map", B0_data, B0_plot)
+if __name__ == "__main__": run_job("B0", ds, FIGDIR, save=SAVE, show=True)
 # %%-
 
 # %%--  1-Map of Bendigo
-#   Fatal and serious injury datasets [Severity 1 or 2]
-B1_df = dfs_dic["ACCIDENT"].loc[dfs_dic["ACCIDENT"]["SEVERITY"]<3].copy(deep=True)
-
-#   Merge to NODE dataset to access location. Remove ACCIDENT_NO duplicates
-B1_df_node = dfs_dic['NODE'].copy(deep=True)
-B1_df_node.drop_duplicates(subset=['ACCIDENT_NO'], inplace=True)
-B1_df = pd.merge(B1_df, B1_df_node,how="left", on="ACCIDENT_NO")
-B1_df['TOTAL_INJURY'] = B1_df['NO_PERSONS_KILLED'] + B1_df['NO_PERSONS_INJ_2']
-
-#   Convert to injury rate percentage
-B1_df['TOTAL_INJURY'] = B1_df['TOTAL_INJURY']/B1_df['TOTAL_INJURY'].sum()*100
-
-#   Plot map of all serious accidents
-figname = "Bendigo injury and fatality map"
-alpha = 0.5
-size = 5
-xmin = 2.41e6
-ymin = 2.505e6
-window = 0.045e6
-
-fig, (ax1) = plt.subplots(nrows=1, ncols=1, figsize=(5,5))
-ax1.scatter(B1_df["VICGRID94_X"],B1_df["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="k")
-
-ax1.set_xlim(xmin, xmin+window)
-ax1.set_ylim(ymin, ymin + window)
-ax1.set_aspect("equal")
-ax1.axis("off")
-
-if SAVE: plt.savefig(FIGDIR+"\\"+datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png",transparent=True,bbox_inches='tight')
-plt.tight_layout()
-plt.show()
+B1_xmin = 2.41e6
+B1_ymin = 2.505e6
+B1_window = 0.045e6
+
+def B1_data(ds):
+    #   Fatal and serious injury accidents joined to their location [shared with B0-B3]
+    B1_df = serious_accident_nodes(ds)
+
+    #   Only keep the accidents inside the window
+    return query_window(B1_df, B1_xmin, B1_ymin, B1_xmin+B1_window, B1_ymin+B1_window)
+
+def B1_plot(B1_df, figname):
+    #   Plot map of all serious accidents
+    alpha = 0.5
+    size = 5
+    xmin, ymin, window = B1_xmin, B1_ymin, B1_window
+
+    fig, (ax1) = plt.subplots(nrows=1, ncols=1, figsize=(5,5))
+    if RENDER == "raster":
+        draw_density(ax1, B1_df["VICGRID94_X"], B1_df["VICGRID94_Y"], weights=B1_df[RASTER_WEIGHT] if RASTER_WEIGHT else None, bounds=(xmin, ymin, xmin+window, ymin+window))
+    else:
+        ax1.scatter(B1_df["VICGRID94_X"],B1_df["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="k")
+
+    ax1.set_xlim(xmin, xmin+window)
+    ax1.set_ylim(ymin, ymin+window)
+    ax1.set_aspect("equal")
+    ax1.axis("off")
+    return fig
+
+figure_job("B1", "Bendigo injury and fatality map", B1_data, B1_plot)
+if __name__ == "__main__": run_job("B1", ds, FIGDIR, save=SAVE, show=True)
 # %%-
 
 # %%--  2-Map of Melbourne
-#   Fatal and serious injury datasets [Severity 1 or 2]
-B2_df = dfs_dic["ACCIDENT"].loc[dfs_dic["ACCIDENT"]["SEVERITY"]<3].copy(deep=True)
-
-#   Merge to NODE dataset to access location. Remove ACCIDENT_NO duplicates
-B2_df_node = dfs_dic['NODE'].copy(deep=True)
-B2_df_node.drop_duplicates(subset=['ACCIDENT_NO'], inplace=True)
-B2_df = pd.merge(B2_df, B2_df_node,how="left", on="ACCIDENT_NO")
-B2_df['TOTAL_INJURY'] = B2_df['NO_PERSONS_KILLED'] + B2_df['NO_PERSONS_INJ_2']
-
-#   Convert to injury rate percentage
-B2_df['TOTAL_INJURY'] = B2_df['TOTAL_INJURY']/B2_df['TOTAL_INJURY'].sum()*100
-
-#   Plot map of all serious accidents
-figname = "Melbourne injury and fatality map"
-alpha = 0.1
-size = 1
-xmin = 2.46725e6
-ymin = 2.3825e6
-window = 0.055e6
-
-fig, (ax1) = plt.subplots(nrows=1, ncols=1, figsize=(5,5))
-ax1.scatter(B2_df["VICGRID94_X"],B2_df["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="k")
-
-ax1.set_xlim(xmin, xmin+window)
-ax1.set_ylim(ymin, ymin+window)
-ax1.set_aspect("equal")
-ax1.axis("off")
-
-if SAVE: plt.savefig(FIGDIR+"\\"+datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png",transparent=True,bbox_inches='tight')
-plt.tight_layout()
-plt.show()
+B2_xmin = 2.46725e6
+B2_ymin = 2.3825e6
+B2_window = 0.055e6
+
+def B2_data(ds):
+    #   Fatal and serious injury accidents joined to their location [shared with B0-B3]
+    B2_df = serious_accident_nodes(ds)
+
+    #   Only keep the accidents inside the window
+    return query_window(B2_df, B2_xmin, B2_ymin, B2_xmin+B2_window, B2_ymin+B2_window)
+
+def B2_plot(B2_df, figname):
+    #   Plot map of all serious accidents
+    alpha = 0.1
+    size = 1
+    xmin, ymin, window = B2_xmin, B2_ymin, B2_window
+
+    fig, (ax1) = plt.subplots(nrows=1, ncols=1, figsize=(5,5))
+    if RENDER == "raster":
+        draw_density(ax1, B2_df["VICGRID94_X"], B2_df["VICGRID94_Y"], weights=B2_df[RASTER_WEIGHT] if RASTER_WEIGHT else None, bounds=(xmin, ymin, xmin+window, ymin+window))
+    else:
+        ax1.scatter(B2_df["VICGRID94_X"],B2_df["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="k")
+
+    ax1.set_xlim(xmin, xmin+window)
+    ax1.set_ylim(ymin, ymin+window)
+    ax1.set_aspect("equal")
+    ax1.axis("off")
+    return fig
+
+figure_job("B2", "Melbourne injury and fatality map", B2_data, B2_plot)
+if __name__ == "__main__": run_job("B2", ds, FIGDIR, save=SAVE, show=True)
 # %%-
 
 # %%--  3-Map of Melbourne CBD
-#   Fatal and serious injury datasets [Severity 1 or 2]
-B3_df = dfs_dic["ACCIDENT"].loc[dfs_dic["ACCIDENT"]["SEVERITY"]<3].copy(deep=True)
-
-#   Merge to NODE dataset to access location. Remove ACCIDENT_NO duplicates
-B3_df_node = dfs_dic['NODE'].copy(deep=True)
-B3_df_node.drop_duplicates(subset=['ACCIDENT_NO'], inplace=True)
-B3_df = pd.merge(B3_df, B3_df_node,how="left", on="ACCIDENT_NO")
-B3_df['TOTAL_INJURY'] = B3_df['NO_PERSONS_KILLED'] + B3_df['NO_PERSONS_INJ_2']
-
-#   Convert to injury rate percentage
-B3_df['TOTAL_INJURY'] = B3_df['TOTAL_INJURY']/B3_df['TOTAL_INJURY'].sum()*100
-
-#   Plot map of all serious accidents
-figname = "Melbourne CBD injury and fatality map"
-alpha = 0.3
-size = 3
-xmin = 2.4945e6
-ymin = 2.4078e6
-window = 0.004e6
-
-fig, (ax1) = plt.subplots(nrows=1, ncols=1, figsize=(5,5))
-ax1.scatter(B3_df["VICGRID94_X"],B3_df["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="k")
-
-ax1.set_xlim(xmin, xmin+window)
-ax1.set_ylim(ymin, ymin+window)
-ax1.set_aspect("equal")
-ax1.axis("off")
-
-if SAVE: plt.savefig(FIGDIR+"\\"+datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")+"_"+figname+".png",transparent=True,bbox_inches='tight')
-plt.tight_layout()
-plt.show()
+B3_xmin = 2.4945e6
+B3_ymin = 2.4078e6
+B3_window = 0.004e6
+
+def B3_data(ds):
+    #   Fatal and serious injury accidents joined to their location [shared with B0-B3]
+    B3_df = serious_accident_nodes(ds)
+
+    #   Only keep the accidents inside the window
+    return query_window(B3_df, B3_xmin, B3_ymin, B3_xmin+B3_window, B3_ymin+B3_window)
+
+def B3_plot(B3_df, figname):
+    #   Plot map of all serious accidents
+    alpha = 0.3
+    size = 3
+    xmin, ymin, window = B3_xmin, B3_ymin, B3_window
+
+    fig, (ax1) = plt.subplots(nrows=1, ncols=1, figsize=(5,5))
+    if RENDER == "raster":
+        draw_density(ax1, B3_df["VICGRID94_X"], B3_df["VICGRID94_Y"], weights=B3_df[RASTER_WEIGHT] if RASTER_WEIGHT else None, bounds=(xmin, ymin, xmin+window, ymin+window))
+    else:
+        ax1.scatter(B3_df["VICGRID94_X"],B3_df["VICGRID94_Y"], marker=".", s=size, alpha=alpha, c="k")
+
+    ax1.set_xlim(xmin, xmin+window)
+    ax1.set_ylim(ymin, ymin+window)
+    ax1.set_aspect("equal")
+    ax1.axis("off")
+    return fig
+
+figure_job("B3", "Melbourne CBD injury and fatality map", B3_data, B3_plot)
+if __name__ == "__main__": run_job("B3", ds, FIGDIR, save=SAVE, show=True)
+# %%-
+
+# %%--  4-Black spots
+B4_state_size = 2000        # Side of the statewide square cells [m]
+B4_cbd_size = 100           # Circumradius of the Melbourne CBD hexagons [m]
+
+def B4_data(ds):
+    #   Fatal and serious injury accidents joined to their location [shared with B0-B3]
+    B4_df = serious_accident_nodes(ds)
+    window = (B3_xmin, B3_ymin, B3_xmin+B3_window, B3_ymin+B3_window)
+
+    #   Injury share of every statewide cell and top black spots, statewide and in the CBD window of B3
+    return {
+        "state": cell_sums(B4_df, B4_state_size, "square"),
+        "state_top": black_spots(B4_df, B4_state_size, "square"),
+        "cbd": cell_sums(query_window(B4_df, *window), B4_cbd_size, "hex"),
+        "cbd_top": black_spots(B4_df, B4_cbd_size, "hex", window=window),
+    }
+
+def B4_report(B4_dfs):
+    #   Print the ranked black spots
+    for key, title in [("state_top", "Statewide"), ("cbd_top", "Melbourne CBD")]:
+        print("%s black spots [persons, TOTAL_INJURY in %% of the injuries]:"%title)
+        print(B4_dfs[key][['RANK','CELL_X','CELL_Y','NO_PERSONS_KILLED','NO_PERSONS_INJ_2','TOTAL_INJURY','ACCIDENTS']].round(3).to_string(index=False))
+
+def B4_plot(B4_dfs, figname):
+    #   Plot statewide cells and CBD hexagons coloured by injury share, with the black spots ranked
+    fig, (ax1,ax2) = plt.subplots(nrows=1, ncols=2, figsize=(10,5))
+    state, state_top = B4_dfs["state"], B4_dfs["state_top"]
+    ax1.scatter(state["CELL_X"], state["CELL_Y"], marker="s", s=1, c=state["TOTAL_INJURY"], cmap="magma_r", norm=LogNorm())
+    ax1.scatter(state_top["CELL_X"], state_top["CELL_Y"], marker="o", s=40, facecolors="none", edgecolors="k")
+
+    cbd, cbd_top = B4_dfs["cbd"], B4_dfs["cbd_top"]
+    hexes = PolyCollection(hex_corners(cbd["CELL_X"].to_numpy(), cbd["CELL_Y"].to_numpy(), B4_cbd_size), array=cbd["TOTAL_INJURY"].to_numpy(), cmap="magma_r", edgecolors="none")
+    ax2.add_collection(hexes)
+    for rank, x, y in zip(cbd_top["RANK"], cbd_top["CELL_X"], cbd_top["CELL_Y"]):
+        ax2.annotate(str(rank), (x, y), ha="center", va="center", fontsize=7, color="w")
+    ax2.set_xlim(B3_xmin, B3_xmin+B3_window)
+    ax2.set_ylim(B3_ymin, B3_ymin+B3_window)
+
+    for ax in (ax1, ax2):
+        ax.set_aspect("equal")
+        ax.axis("off")
+    return fig
+
+figure_job("B4", "Black spots map", B4_data, B4_plot, B4_report)
+if __name__ == "__main__": run_job("B4", ds, FIGDIR, save=SAVE, show=True)
 # %%-
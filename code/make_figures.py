@@ -0,0 +1,117 @@
+"Command line entry point rendering the figure jobs headless and in parallel"
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import matplotlib
+matplotlib.use("Agg")
+from columnstore import open_dataset
+from dataloader import enable_copy_on_write
+from incremental import incremental_store
+from derived import accident_features
+from keyindex import key_index
+from jobs import JOBS, select_jobs, run_job
+from profiling import records, stage, summary, write_report
+import injury_statistics
+import location_statistics
+
+# %%--  Settings
+DIR = Path(__file__).parent.parent
+DATADIR = str(DIR/'data')
+FIGDIR = str(DIR/'figures')
+_DATASET = None
+# %%-
+
+# %%--  Workers
+def init_worker(datadir, render, incremental, store="parquet", date_range=(None, None)):
+    """Set up the dataset used by the jobs of this process.
+
+    With the fork start method the dataset of the parent, and every table it
+    already loaded, is inherited and shared copy-on-write. Other start methods
+    open a new lazy dataset on the same parquet cache, or map the column store
+    which shares its pages between all workers. Copy-on-write is turned on in
+    every process, see dataloader.COPY_ON_WRITE.
+    """
+    global _DATASET
+    enable_copy_on_write()
+    if _DATASET is None or str(_DATASET.datadir) != str(datadir): _DATASET = open_dataset(datadir, store)
+    location_statistics.RENDER = render
+    injury_statistics.INCREMENTAL = incremental
+    injury_statistics.DATE_RANGE = tuple(date_range)
+
+def timed_job(name, figdir, save, cache=True):
+    "Run one job on the process dataset, returns its name, figure path, duration and profiling records"
+    start = time.perf_counter()
+    path = run_job(name, _DATASET, figdir, save=save, cache=cache)
+    return name, path, time.perf_counter()-start, records(clear=True)
+# %%-
+
+# %%--  Command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render the crash statistics figures")
+    parser.add_argument("jobs", nargs="*", help="Jobs to run, by name or pattern [e.g. A2 'B*'], all by default")
+    parser.add_argument("--list", action="store_true", help="List the available jobs and exit")
+    parser.add_argument("--datadir", default=DATADIR, help="Folder with the CrashStats csv files")
+    parser.add_argument("--figdir", default=FIGDIR, help="Folder where the figures are saved")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--render", choices=["scatter", "raster"], default=location_statistics.RENDER, help="Rendering mode of the maps")
+    parser.add_argument("--incremental", action="store_true", help="Update the persisted A1 and A2 aggregates instead of recomputing them")
+    parser.add_argument("--store", choices=["parquet", "columns"], default="parquet", help="Read the tables from the parquet cache or the memory-mapped column store")
+    parser.add_argument("--start", help="First accident date of the A sections [e.g. 2015-01-01]")
+    parser.add_argument("--end", help="Last accident date of the A sections, inclusive")
+    parser.add_argument("--preload", action="store_true", help="Read every table before starting the workers so they share it")
+    parser.add_argument("--profile", metavar="REPORT", help="Write the time, memory and rows of every stage to a .json or .csv report")
+    parser.add_argument("--no-save", dest="save", action="store_false", help="Render without saving the figures")
+    parser.add_argument("--force", dest="cache", action="store_false", help="Render every figure again, even when its data, style and plot code are unchanged")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global _DATASET
+    args = parse_args(argv)
+    if args.list:
+        for name, job in JOBS.items(): print("%s\t%s"%(name, job.figname))
+        return
+
+    try:
+        names = select_jobs(args.jobs)
+    except KeyError as e:
+        raise SystemExit(e.args[0])
+    Path(args.figdir).mkdir(parents=True, exist_ok=True)
+
+    enable_copy_on_write()
+    #   Build the parquet cache, the key index and the accident features once, before any worker needs them
+    _DATASET = open_dataset(args.datadir, args.store)
+    with stage("prepare"):
+        for table in _DATASET.prepare():
+            print("Parsed %-24s %9d rows in %6.2fs  %10.0f rows/s %7.1f MB/s"%(table["table"], table["rows"], table["seconds"], table["rows_per_second"], table["mb_per_second"]))
+        key_index(_DATASET)
+        accident_features(_DATASET)
+        if args.preload:
+            for filename in _DATASET.keys(): _DATASET[filename]
+        init_worker(args.datadir, args.render, args.incremental, args.store, (args.start, args.end))
+        if args.incremental: incremental_store(_DATASET)
+    report = records(clear=True)
+
+    start = time.perf_counter()
+    workers = max(min(args.workers or 1, len(names)), 1)
+    if workers == 1:
+        for name in names:
+            name, path, duration, job_records = timed_job(name, args.figdir, args.save, args.cache)
+            report += job_records
+            print("%s\t%.2fs\t%s"%(name, duration, path or ""))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(args.datadir, args.render, args.incremental, args.store, (args.start, args.end))) as pool:
+            futures = [pool.submit(timed_job, name, args.figdir, args.save, args.cache) for name in names]
+            for future in as_completed(futures):
+                name, path, duration, job_records = future.result()
+                report += job_records
+                print("%s\t%.2fs\t%s"%(name, duration, path or ""))
+    print("%d jobs in %.2fs with %d workers"%(len(names), time.perf_counter()-start, workers))
+    if args.profile:
+        for total in summary(report)[:10]: print("%-32s %4d calls %8.2fs wall %8.2fs cpu"%(total["stage"], total["calls"], total["seconds"], total["cpu_seconds"]))
+        print("Profile written to %s"%write_report(args.profile, report))
+
+if __name__ == "__main__":
+    main()
+# %%-
@@ -0,0 +1,147 @@
+"Lightweight wall time, CPU time, memory and row count instrumentation of the sections and their stages"
+import contextlib
+import csv
+import functools
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+from pathlib import Path
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+# %%--  Settings
+ENABLED = True          # Cheap enough to leave on: two clock reads and one getrusage call per stage
+FIELDS = ["stage", "pid", "seconds", "cpu_seconds", "peak_rss_delta_mb", "rows"]
+_RECORDS = []
+_LOCAL = threading.local()     # Stage stack of each thread, so concurrent threads do not nest into each other
+# %%-
+
+# %%--  Measurement
+def peak_rss():
+    "Peak resident set size of the process [MB], None where the resource module is missing"
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #   Kilobytes on Linux, bytes on macOS
+    return peak/2**20 if sys.platform == "darwin" else peak/2**10
+
+def isolated(func, setup=None):
+    """Run func in a forked child, returns its result, wall time [s] and peak RSS growth [MB].
+
+    The child starts from the memory of the parent with its own high-water
+    mark, so the peak counts every allocation of func, Arrow buffers included,
+    and none of the earlier peaks of the parent. setup runs in the child before
+    the measurement [e.g. to start the thread pools of a library]. The result
+    is sent back pickled and changes func makes to the memory of the child are
+    lost. Runs in this process where fork or the resource module are missing.
+    """
+    if not hasattr(os, "fork") or resource is None:
+        rss, start = peak_rss(), time.perf_counter()
+        result = func()
+        return result, time.perf_counter()-start, None if rss is None else peak_rss()-rss
+    sys.stdout.flush()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            if setup is not None: setup()
+            rss, start = peak_rss(), time.perf_counter()
+            result = func()
+            payload = pickle.dumps((True, (result, time.perf_counter()-start, peak_rss()-rss)))
+        except BaseException as e:
+            payload = pickle.dumps((False, "%s: %s"%(type(e).__name__, e)))
+        with os.fdopen(write_fd, "wb") as f: f.write(payload)
+        sys.stdout.flush()
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as f: payload = f.read()
+    os.waitpid(pid, 0)
+    if not payload: raise RuntimeError("Isolated child %d exited without a result"%pid)
+    ok, value = pickle.loads(payload)
+    if not ok: raise RuntimeError("Isolated call failed in child %d: %s"%(pid, value))
+    return value
+
+def count_rows(result):
+    "Number of rows of a stage result: length of a frame, or total over a dictionary of frames"
+    if hasattr(result, "columns") and hasattr(result, "__len__"): return len(result)
+    if isinstance(result, dict):
+        counts = [count_rows(value) for value in result.values()]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """Record the wall time, CPU time, peak RSS growth and rows of a block.
+
+    Nested stages are recorded as parent/child, e.g. A3/data/read. The record
+    is yielded so the block can set its rows once known. Peak RSS delta is how
+    much the block raised the high-water mark of the process, so a stage
+    reusing memory freed by a previous one shows 0.
+    """
+    if not ENABLED:
+        yield {}
+        return
+    if not hasattr(_LOCAL, "stack"): _LOCAL.stack = []
+    _LOCAL.stack.append(name)
+    record = {"stage": "/".join(_LOCAL.stack), "pid": os.getpid(), "rows": rows}
+    wall, cpu, rss = time.perf_counter(), time.process_time(), peak_rss()
+    try:
+        yield record
+    finally:
+        _LOCAL.stack.pop()
+        record["seconds"] = time.perf_counter()-wall
+        record["cpu_seconds"] = time.process_time()-cpu
+        record["peak_rss_delta_mb"] = None if rss is None else peak_rss()-rss
+        _RECORDS.append(record)
+
+def profiled(name=None):
+    "Decorator recording every call of a function as a stage, with the rows of its result"
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__name__) as record:
+                result = func(*args, **kwargs)
+                if ENABLED: record["rows"] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
+# %%-
+
+# %%--  Report
+def records(clear=False):
+    "Stages recorded by this process, in completion order"
+    recorded = list(_RECORDS)
+    if clear: _RECORDS.clear()
+    return recorded
+
+def write_report(path, recorded=None):
+    "Write the records as a csv or json run report, depending on the file extension"
+    recorded = records() if recorded is None else recorded
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".csv":
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(recorded)
+    else:
+        with open(path, "w") as f: json.dump(recorded, f, indent=1)
+    return path
+
+def summary(recorded=None):
+    "Total wall and CPU time of every stage name over all calls, slowest first"
+    recorded = records() if recorded is None else recorded
+    totals = {}
+    for record in recorded:
+        total = totals.setdefault(record["stage"], {"stage": record["stage"], "calls": 0, "seconds": 0, "cpu_seconds": 0})
+        total["calls"] += 1
+        total["seconds"] += record["seconds"]
+        total["cpu_seconds"] += record["cpu_seconds"]
+    return sorted(totals.values(), key=lambda total: -total["seconds"])
+# %%-
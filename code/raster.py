@@ -0,0 +1,79 @@
+"Rasterised density rendering of point maps"
+import numpy as np
+import matplotlib.colors as mcolors
+
+# %%--  Settings
+RESOLUTION = 400        # Pixels along the longest side of the raster
+# %%-
+
+# %%--  Binning
+def rasterize(x, y, weights=None, bounds=None, resolution=RESOLUTION):
+    """Bin points into a fixed resolution 2D histogram with square pixels.
+
+    bounds is (xmin, ymin, xmax, ymax), defaulting to the extent of the points.
+    Returns the grid indexed [row, column] from the bottom left corner and the
+    (xmin, xmax, ymin, ymax) extent to pass to imshow.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+        valid &= np.isfinite(weights)
+    if bounds is None:
+        bounds = (x[valid].min(), y[valid].min(), x[valid].max(), y[valid].max()) if valid.any() else (0, 0, 1, 1)
+    xmin, ymin, xmax, ymax = bounds
+    pixel = max(xmax-xmin, ymax-ymin)/resolution
+    nx = max(int(np.ceil((xmax-xmin)/pixel)), 1)
+    ny = max(int(np.ceil((ymax-ymin)/pixel)), 1)
+
+    #   Points on the upper edges belong to the last pixel, points outside are dropped
+    valid &= (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    ix = np.minimum(((x[valid]-xmin)/pixel).astype(np.int64), nx-1)
+    iy = np.minimum(((y[valid]-ymin)/pixel).astype(np.int64), ny-1)
+    grid = np.bincount(
+        iy*nx+ix,
+        weights=weights[valid] if weights is not None else None,
+        minlength=nx*ny,
+    ).reshape(ny, nx)
+    return grid, (xmin, xmin+nx*pixel, ymin, ymin+ny*pixel)
+# %%-
+
+# %%--  Colour scaling
+def log_scale(grid):
+    "Log scaled grid, empty pixels set to nan so they stay transparent"
+    scaled = np.full(grid.shape, np.nan)
+    mask = grid > 0
+    scaled[mask] = np.log1p(grid[mask])
+    return scaled
+
+def eq_hist(grid):
+    "Histogram equalised grid in ]0, 1], empty pixels set to nan so they stay transparent"
+    scaled = np.full(grid.shape, np.nan)
+    mask = grid > 0
+    values, inverse, counts = np.unique(grid[mask], return_inverse=True, return_counts=True)
+    cdf = np.cumsum(counts)/counts.sum()
+    scaled[mask] = cdf[inverse]
+    return scaled
+
+SCALINGS = {"log": log_scale, "eq_hist": eq_hist}
+
+def color_cmap(color):
+    "Colormap going from transparent to a single colour"
+    rgb = mcolors.to_rgb(color)
+    return mcolors.LinearSegmentedColormap.from_list("density_"+str(color), [rgb+(0.,), rgb+(1.,)])
+# %%-
+
+# %%--  Drawing
+def draw_density(ax, x, y, weights=None, bounds=None, resolution=RESOLUTION, how="eq_hist", color="k"):
+    "Draw the points as a single density image instead of one marker per point"
+    grid, extent = rasterize(x, y, weights=weights, bounds=bounds, resolution=resolution)
+    return ax.imshow(
+        SCALINGS[how](grid),
+        origin="lower",
+        extent=extent,
+        cmap=color_cmap(color),
+        interpolation="nearest",
+        vmin=0,
+    )
+# %%-
@@ -0,0 +1,118 @@
+"Persistent monthly rollups of the person counts by the main categories, with date range and rolling window queries"
+import numpy as np
+import pandas as pd
+from derived import FEATURE_TABLES, FEATURES_VERSION, derived_table, read_features
+from profiling import profiled
+
+# %%--  Settings
+ROLLUP_DIMS = ['SEVERITY', 'SPEED_ZONE', 'Light Condition Desc', 'Road Geometry Desc', 'Vehicle Type Desc']
+ROLLUP_MEASURES = ['NO_PERSONS_KILLED', 'NO_PERSONS_INJ_2', 'NO_PERSONS_INJ_3', 'NO_PERSONS_NOT_INJ']
+# %%-
+
+# %%--  Row-level data
+def month_end(date):
+    "Month bucket of a date, labelled by its last day as pd.Grouper(freq='M')"
+    return date.dt.to_period('M').dt.end_time.dt.normalize()
+
+def date_filters(start=None, end=None):
+    "ACCIDENTDATE filters of an inclusive date range, for CrashDataset.read"
+    filters = []
+    if start is not None: filters.append(("ACCIDENTDATE", ">=", pd.Timestamp(start)))
+    if end is not None: filters.append(("ACCIDENTDATE", "<=", pd.Timestamp(end)))
+    return filters
+
+def accident_rows(ds, start=None, end=None):
+    "Accidents of a date range with the rollup dimensions, vehicle type being the one of vehicle A"
+    df = read_features(ds, columns=['ACCIDENTDATE']+ROLLUP_DIMS+ROLLUP_MEASURES, filters=date_filters(start, end))
+    df['MONTH'] = month_end(df['ACCIDENTDATE'])
+    return df
+
+def rollup_rows(rows):
+    "Sums of the measures and accident counts by month and level of every dimension, missing levels included"
+    rows = rows.assign(**{dim: rows[dim].astype(object) for dim in ROLLUP_DIMS})
+    groups = rows.groupby(['MONTH']+ROLLUP_DIMS, dropna=False)
+    df = groups[ROLLUP_MEASURES].sum().astype(np.int64)
+    df['ACCIDENTS'] = groups.size()
+    return df.reset_index()
+
+@derived_table(tables=FEATURE_TABLES, version=(1, FEATURES_VERSION))
+def monthly_rollup(ds):
+    "Monthly rollup of every accident, one row per month and combination of the dimensions levels"
+    return rollup_rows(accident_rows(ds))
+# %%-
+
+# %%--  Queries
+def split_months(start=None, end=None):
+    """Split an inclusive date range into the whole months served by the rollup and
+    the partial months at its edges, which need the row-level data.
+
+    Returns the first and last whole month ends [None when open] and a list of
+    (start, end) partial ranges.
+    """
+    start = None if start is None else pd.Timestamp(start).normalize()
+    end = None if end is None else pd.Timestamp(end).normalize()
+    first, last, partial = None, None, []
+    if start is not None:
+        first = start+pd.offsets.MonthEnd(0)
+        if start.day != 1:
+            partial.append((start, first if end is None else min(first, end)))
+            first = first+pd.offsets.MonthEnd(1)
+    if end is not None:
+        last = end+pd.offsets.MonthEnd(0)
+        if end != last:
+            month_start = end-pd.offsets.MonthBegin(1) if end.day != 1 else end
+            edge = (month_start if start is None else max(start, month_start), end)
+            if edge not in partial: partial.append(edge)
+            last = month_start-pd.offsets.Day(1)
+    return first, last, partial
+
+@profiled("rollup_query")
+def query(ds, start=None, end=None, by=(), where=None):
+    """Sums of the person counts and number of accidents between two dates [inclusive] by dimensions.
+
+    by lists rollup dimensions and/or MONTH, where restricts levels as
+    {dimension: levels}, e.g. {'SEVERITY': [1, 2]}. Whole months are read from
+    the persisted rollup; the row-level data is only read for the partial
+    months at the edges of the range.
+    """
+    by = list(by)
+    first, last, partial = split_months(start, end)
+    rollup = monthly_rollup(ds)
+    keep = np.ones(len(rollup), dtype=bool)
+    if first is not None: keep &= (rollup['MONTH'] >= first).to_numpy()
+    if last is not None: keep &= (rollup['MONTH'] <= last).to_numpy()
+    parts = [rollup.loc[keep]]
+    for lo, hi in partial: parts.append(rollup_rows(accident_rows(ds, lo, hi)))
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    for dim, levels in (where or {}).items():
+        df = df.loc[df[dim].isin(levels)]
+    if not by: return df[ROLLUP_MEASURES+['ACCIDENTS']].sum()
+    return df.groupby(by, dropna=False)[ROLLUP_MEASURES+['ACCIDENTS']].sum().reset_index()
+
+def monthly_series(ds, start=None, end=None, where=None):
+    "Monthly sums with every month of the range, as groupby(pd.Grouper(key='ACCIDENTDATE', freq='M')).sum()"
+    df = query(ds, start, end, by=['MONTH'], where=where).set_index('MONTH').sort_index()
+    if len(df): df = df.reindex(pd.date_range(df.index.min(), df.index.max(), freq='M'), fill_value=0)
+    df.index.name = 'ACCIDENTDATE'
+    return df.reset_index()
+
+def rolling(ds, months=12, by=(), where=None, start=None, end=None):
+    """Trailing sums over a window of months at every month end of the range.
+
+    Months without accidents count as zero, and the first months-1 months of
+    the range, whose window is incomplete, are dropped. A range without any
+    accident gives an empty frame.
+    """
+    by = list(by)
+    df = query(ds, start, end, by=['MONTH']+by, where=where)
+    measures = ROLLUP_MEASURES+['ACCIDENTS']
+    if not len(df): return pd.DataFrame(columns=['MONTH']+by+measures)
+    df = df.set_index(['MONTH']+by)[measures]
+    if by: df = df.unstack(by, fill_value=0)
+    df = df.sort_index()
+    df = df.reindex(pd.date_range(df.index.min(), df.index.max(), freq='M'), fill_value=0)
+    df = df.rolling(months).sum().iloc[months-1:]
+    df.index.name = 'MONTH'
+    if by: df = df.stack(list(range(1, len(by)+1)))
+    return df.reset_index()
+# %%-
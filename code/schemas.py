@@ -0,0 +1,120 @@
+"Explicit column types and missing value markers of the CrashStats csv tables"
+import pyarrow as pa
+
+# %%--  Settings
+DATE_FORMAT = "%d/%m/%Y"
+CATEGORY_TYPE = pa.dictionary(pa.int32(), pa.string())
+ARROW_TYPES = {
+    "string": pa.string(),
+    "category": CATEGORY_TYPE,
+    "date": pa.timestamp("ns"),
+    "int8": pa.int8(),
+    "int16": pa.int16(),
+    "int32": pa.int32(),
+    "float64": pa.float64(),
+}
+
+#   Columns missing from a schema are inferred and typed by optimise_dtypes, so a new column in a release still loads
+SEQUENCE_SCHEMA = {"ACCIDENT_NO": "string"}
+SCHEMAS = {
+    "ACCIDENT": {
+        "ACCIDENT_NO": "string",
+        "ACCIDENTDATE": "date",
+        "ACCIDENTTIME": "category",
+        "ACCIDENT_TYPE": "int16",
+        "Accident Type Desc": "category",
+        "DAY_OF_WEEK": "int16",
+        "Day Week Description": "category",
+        "DCA_CODE": "int16",
+        "DCA Description": "category",
+        "DIRECTORY": "category",
+        "GRID_REFERENCE_X": "category",
+        "LIGHT_CONDITION": "int16",
+        "Light Condition Desc": "category",
+        "NODE_ID": "int32",
+        "NO_OF_VEHICLES": "int16",
+        "NO_PERSONS": "int16",
+        "NO_PERSONS_INJ_2": "int16",
+        "NO_PERSONS_INJ_3": "int16",
+        "NO_PERSONS_KILLED": "int16",
+        "NO_PERSONS_NOT_INJ": "int16",
+        "POLICE_ATTEND": "int16",
+        "ROAD_GEOMETRY": "int16",
+        "Road Geometry Desc": "category",
+        "SEVERITY": "int8",
+        "SPEED_ZONE": "int16",
+    },
+    "ACCIDENT_CHAINAGE": SEQUENCE_SCHEMA,
+    "ACCIDENT_EVENT": SEQUENCE_SCHEMA,
+    "ACCIDENT_LOCATION": SEQUENCE_SCHEMA,
+    "ATMOSPHERIC_COND": {
+        "ACCIDENT_NO": "string",
+        "ATMOSPH_COND": "int16",
+        "ATMOSPH_COND_SEQ": "int16",
+        "Atmosph Cond Desc": "category",
+    },
+    "NODE_ID_COMPLEX_INT_ID": SEQUENCE_SCHEMA,
+    "NODE": {
+        "ACCIDENT_NO": "string",
+        "NODE_ID": "int32",
+        "NODE_TYPE": "category",
+        "VICGRID94_X": "float64",
+        "VICGRID94_Y": "float64",
+        "LGA_NAME": "category",
+        "LGA_NAME_ALL": "category",
+        "DEG_URBAN_NAME": "category",
+        "Lat": "float64",
+        "Long": "float64",
+    },
+    "PERSON": {
+        "ACCIDENT_NO": "string",
+        "VEHICLE_ID": "category",
+        "SEX": "category",
+        "Age Group": "category",
+        "INJ_LEVEL": "int16",
+        "Inj Level Desc": "category",
+        "SEATING_POSITION": "category",
+        "ROAD_USER_TYPE": "int16",
+        "Road User Type Desc": "category",
+        "LICENCE_STATE": "category",
+        "TAKEN_HOSPITAL": "category",
+    },
+    "SUBDCA": SEQUENCE_SCHEMA,
+    "VEHICLE": {
+        "ACCIDENT_NO": "string",
+        "VEHICLE_ID": "category",
+        "VEHICLE_YEAR_MANUF": "float64",
+        "INITIAL_DIRECTION": "category",
+        "Road Surface Type Desc": "category",
+        "REG_STATE": "category",
+        "VEHICLE_BODY_STYLE": "category",
+        "VEHICLE_MAKE": "category",
+        "VEHICLE_MODEL": "category",
+        "VEHICLE_TYPE": "int16",
+        "Vehicle Type Desc": "category",
+        "CONSTRUCTION_TYPE": "category",
+        "FUEL_TYPE": "category",
+        "FINAL_DIRECTION": "category",
+        "TRAILER_TYPE": "category",
+        "VEHICLE_COLOUR_1": "category",
+        "VEHICLE_COLOUR_2": "category",
+        "INITIAL_IMPACT": "category",
+        "Traffic Control Desc": "category",
+    },
+}
+
+#   Values standing for an unknown value, replaced by missing values when parsing
+NA_MARKERS = {
+    "VEHICLE": {"VEHICLE_YEAR_MANUF": [0]},
+}
+# %%-
+
+# %%--  Schema access
+def schema(filename):
+    "Declared column types of a table, empty for unknown tables"
+    return SCHEMAS.get(filename, {})
+
+def arrow_column_types(filename):
+    "Column types of a table for pyarrow.csv.ConvertOptions"
+    return {col: ARROW_TYPES[kind] for col, kind in schema(filename).items()}
+# %%-
@@ -0,0 +1,88 @@
+"Uniform grid spatial index over VICGRID94 coordinates"
+import weakref
+import numpy as np
+
+# %%--  Settings
+CELL_SIZE = 1000        # Grid cell side in VICGRID94 metres
+_INDEXES = {}
+# %%-
+
+# %%--  Grid index
+class GridIndex:
+    """Points bucketed into square cells and stored in CSR layout.
+
+    Row positions are sorted by cell so the points of a cell are one
+    contiguous slice of order, delimited by offsets. Queries only visit the
+    cells overlapping the window and return positional row indices (sorted),
+    to be used with df.iloc. Points with missing coordinates are never returned.
+    """
+    def __init__(self, x, y, cell_size=CELL_SIZE):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.cell_size = float(cell_size)
+        valid = np.flatnonzero(np.isfinite(self.x) & np.isfinite(self.y))
+        if len(valid):
+            self.x0, self.y0 = self.x[valid].min(), self.y[valid].min()
+            self.nx = int((self.x[valid].max()-self.x0)//self.cell_size)+1
+            self.ny = int((self.y[valid].max()-self.y0)//self.cell_size)+1
+        else:
+            self.x0, self.y0, self.nx, self.ny = 0., 0., 1, 1
+        cells = self._cell(self.x[valid], self.y[valid])
+        sort = np.argsort(cells, kind="stable")
+        self.order = valid[sort]
+        self.offsets = np.zeros(self.nx*self.ny+1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.nx*self.ny), out=self.offsets[1:])
+
+    @classmethod
+    def from_frame(cls, df, xcol="VICGRID94_X", ycol="VICGRID94_Y", cell_size=CELL_SIZE):
+        return cls(df[xcol], df[ycol], cell_size=cell_size)
+
+    def _cell(self, x, y):
+        ix = ((x-self.x0)//self.cell_size).astype(np.int64)
+        iy = ((y-self.y0)//self.cell_size).astype(np.int64)
+        return iy*self.nx+ix
+
+    def _candidates(self, xmin, ymin, xmax, ymax):
+        "Row positions of the points in the cells overlapping the window"
+        ix0 = max(int((xmin-self.x0)//self.cell_size), 0)
+        ix1 = min(int((xmax-self.x0)//self.cell_size), self.nx-1)
+        iy0 = max(int((ymin-self.y0)//self.cell_size), 0)
+        iy1 = min(int((ymax-self.y0)//self.cell_size), self.ny-1)
+        if ix0 > ix1 or iy0 > iy1: return np.zeros(0, dtype=np.int64)
+        #   Cells of a grid row are contiguous so each row of the window is one slice
+        rows = np.arange(iy0, iy1+1)*self.nx
+        starts = self.offsets[rows+ix0]
+        ends = self.offsets[rows+ix1+1]
+        return np.concatenate([self.order[s:e] for s, e in zip(starts, ends)])
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        "Sorted row positions of the points inside [xmin, xmax] x [ymin, ymax]"
+        rows = self._candidates(xmin, ymin, xmax, ymax)
+        x, y = self.x[rows], self.y[rows]
+        return np.sort(rows[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)])
+
+    def query_radius(self, x, y, radius):
+        "Sorted row positions of the points within radius of (x, y)"
+        rows = self._candidates(x-radius, y-radius, x+radius, y+radius)
+        dist2 = (self.x[rows]-x)**2+(self.y[rows]-y)**2
+        return np.sort(rows[dist2 <= radius**2])
+# %%-
+
+# %%--  Shared indexes
+def frame_index(df, xcol="VICGRID94_X", ycol="VICGRID94_Y", cell_size=CELL_SIZE):
+    "Grid index of a frame, built once per frame and reused by every window query while the frame is alive"
+    key = (id(df), xcol, ycol, cell_size)
+    if key not in _INDEXES:
+        _INDEXES[key] = GridIndex.from_frame(df, xcol, ycol, cell_size)
+        #   Forget the index when the frame is freed, so its id cannot match a later frame
+        weakref.finalize(df, _INDEXES.pop, key, None)
+    return _INDEXES[key]
+
+def clear_indexes():
+    "Forget the grid indexes held by this process"
+    _INDEXES.clear()
+
+def query_window(df, xmin, ymin, xmax, ymax, xcol="VICGRID94_X", ycol="VICGRID94_Y"):
+    "Rows of df located inside the window, queried through the shared grid index"
+    return df.iloc[frame_index(df, xcol, ycol).query_bbox(xmin, ymin, xmax, ymax)]
+# %%-
@@ -0,0 +1,112 @@
+"Out-of-core chunked joins of the large tables against a small set of accidents"
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+from pathlib import Path
+from dataloader import apply_filters, cache_paths, is_cache_valid, mark_missing, optimise_dtypes
+from profiling import profiled
+
+# %%--  Settings
+CHUNK_ROWS = 250000     # Rows of the large table held in memory at once
+# %%-
+
+# %%--  Chunked reads
+def iter_chunks(ds, filename, columns=None, filters=None, chunk_rows=CHUNK_ROWS):
+    """Yield a table in chunks of at most chunk_rows rows.
+
+    Chunks are read by record batch from the parquet cache, or straight from
+    the csv when the cache is missing or outdated, so the full table is never
+    held in memory. filters are (column, operator, value) tuples as in
+    CrashDataset.read.
+    """
+    filters = filters or []
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(list(columns)+[col for col, _, _ in filters]))
+    if is_cache_valid(ds.datadir, filename):
+        parquet = pq.ParquetFile(cache_paths(ds.datadir, filename)[0])
+        batches = (batch.to_pandas() for batch in parquet.iter_batches(batch_size=chunk_rows, columns=read_columns))
+    else:
+        csv_path = Path(ds.datadir)/(filename+".csv")
+        batches = (mark_missing(optimise_dtypes(df), filename) for df in pd.read_csv(csv_path, usecols=read_columns, chunksize=chunk_rows, low_memory=False))
+    for df in batches:
+        if filters: df = apply_filters(df, filters)
+        if columns is not None: df = df[list(columns)]
+        yield df
+# %%-
+
+# %%--  Streaming join
+class StreamingJoin:
+    """Inner join of a chunked large table against a small keyed frame, folded into running sums.
+
+    The small frame [e.g. the filtered ACCIDENT rows] is indexed once by its key
+    so each chunk is matched with a hash lookup. Every chunk is joined, reduced
+    to sums by dimension and discarded, so memory stays bounded by the chunk
+    size whatever the size of the large table [PERSON, VEHICLE].
+    """
+    def __init__(self, small, on="ACCIDENT_NO"):
+        self.on = on
+        self.small = small.drop_duplicates(subset=[on]).set_index(on)
+
+    def join(self, chunk):
+        "Rows of the chunk with a matching key, with the columns of the small frame appended"
+        positions = self.small.index.get_indexer(chunk[self.on])
+        keep = positions >= 0
+        joined = chunk.loc[keep].reset_index(drop=True)
+        right = self.small.iloc[positions[keep]].reset_index(drop=True)
+        for col in right.columns:
+            if col not in joined.columns: joined[col] = right[col].to_numpy()
+        return joined
+
+    @profiled("stream_join")
+    def first(self, chunks):
+        """First matching row of the chunked table for every key of the small frame, indexed by key.
+
+        Each chunk is reduced to the keys not found in earlier chunks before it
+        is kept, so at most one row per key is held whatever the size of the
+        large table. Keys without any row are left out, use join to align.
+        """
+        found = np.zeros(len(self.small), dtype=bool)
+        parts = []
+        for chunk in chunks:
+            positions = self.small.index.get_indexer(chunk[self.on])
+            keep = positions >= 0
+            keep[keep] = ~found[positions[keep]]
+            rows = np.flatnonzero(keep)
+            positions, first = np.unique(positions[rows], return_index=True)
+            found[positions] = True
+            parts.append(chunk.iloc[rows[first]])
+        if not parts: return pd.DataFrame(columns=[self.on]).set_index(self.on)
+        df = pd.concat(parts, ignore_index=True)
+        #   Chunks encoded with other dictionaries concatenate to object columns
+        for col in parts[0].columns:
+            if parts[0][col].dtype.name == "category" and df[col].dtype.name != "category":
+                df[col] = union_categoricals([part[col] for part in parts], sort_categories=True)
+        return df.set_index(self.on)
+
+    @profiled("stream_join")
+    def collect(self, chunks):
+        "Concatenated joined chunks, for selections small enough to hold in memory once filtered"
+        joined = [self.join(chunk) for chunk in chunks]
+        return pd.concat(joined, ignore_index=True) if joined else self.join(pd.DataFrame(columns=[self.on]))
+
+    @profiled("stream_join")
+    def aggregate(self, chunks, dims, measures):
+        """Sums of the measures by level of each dimension, computed in one pass over the chunks.
+
+        Returns a dictionary of frames indexed by dimension level, equivalent to
+        merge(...).groupby(dim)[measures].sum() for each dimension.
+        """
+        totals = {dim: None for dim in dims}
+        for chunk in chunks:
+            joined = self.join(chunk)
+            for dim in dims:
+                part = joined.groupby(dim, observed=True)[measures].sum()
+                part.index = part.index.astype(object)
+                totals[dim] = part if totals[dim] is None else totals[dim].add(part, fill_value=0)
+        return {
+            dim: (df if df is not None else pd.DataFrame(columns=measures)).sort_index().rename_axis(dim)
+            for dim, df in totals.items()
+        }
+# %%-
@@ -0,0 +1,33 @@
+"Rolling window queries of the monthly rollups on a small synthetic extract"
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+sys.path.insert(0, str(Path(__file__).parent.parent/'code'))
+sys.path.insert(0, str(Path(__file__).parent.parent/'benchmarks'))
+from dataloader import CrashDataset
+from rollups import ROLLUP_MEASURES, rolling
+from synthetic import generate
+
+# %%--  Dataset
+@pytest.fixture(scope="module")
+def ds(tmp_path_factory):
+    "Synthetic extract of about 2000 accidents between 2006 and 2020"
+    datadir = tmp_path_factory.mktemp("crash")
+    generate(datadir, scale=0.01)
+    return CrashDataset(datadir)
+# %%-
+
+# %%--  Rolling windows
+@pytest.mark.parametrize("by", [(), ("SEVERITY",)])
+def test_rolling_empty_date_range(ds, by):
+    df = rolling(ds, months=12, by=by, start="1990-01-01", end="1990-12-31")
+    assert df.empty
+    assert list(df.columns) == ['MONTH']+list(by)+ROLLUP_MEASURES+['ACCIDENTS']
+
+def test_rolling_date_range(ds):
+    df = rolling(ds, months=12, start="2010-01-01", end="2012-12-31")
+    assert len(df) == 25
+    assert df['MONTH'].iloc[0] == pd.Timestamp("2010-12-31")
+    assert (df['ACCIDENTS'] > 0).all()
+# %%-